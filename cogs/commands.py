@@ -19,7 +19,10 @@ class CommandsCog(commands.Cog):
     @app_commands.choices(action=[
         app_commands.Choice(name="Bildgenerierung abbrechen", value=BotActions.INTERRUPT),
         app_commands.Choice(name="Bildgenerierungsmodelle aus VRAM entfernen", value=BotActions.UNLOAD_COMFY),
-        app_commands.Choice(name="Nachrichtenverlauf zurücksetzen", value=BotActions.RESET)
+        app_commands.Choice(name="Nachrichtenverlauf zurücksetzen", value=BotActions.RESET),
+        app_commands.Choice(name="Sprachmodell Status anzeigen", value=BotActions.MODEL_STATUS),
+        app_commands.Choice(name="Sprachmodell laden", value=BotActions.MODEL_LOAD),
+        app_commands.Choice(name="Sprachmodell aus VRAM entfernen", value=BotActions.MODEL_UNLOAD),
     ])
 
     @app_commands.command(name=Config.COMMAND_NAME, description="Steuere den Bot")
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, AsyncIterator
+
+
+class ChannelCoalescer:
+    """Fasst kurz aufeinanderfolgende Erwähnungen in einem Channel zu einer einzigen Generierung zusammen.
+    Nur die neueste Anfrage eines Channels wird ausgeführt, ältere werden verworfen statt eingereiht."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._latest: Dict[int, int] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+        self.dropped = 0
+
+    def _is_latest(self, channel_id: int, ticket: int) -> bool:
+        return self._latest.get(channel_id) == ticket
+
+    @asynccontextmanager
+    async def coalesce(self, channel_id: int) -> AsyncIterator[bool]:
+        """Liefert True, wenn diese Anfrage ausgeführt werden soll, und False, wenn eine neuere sie ersetzt hat"""
+
+        ticket = self._latest.get(channel_id, 0) + 1
+        self._latest[channel_id] = ticket
+
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+
+        if not self._is_latest(channel_id, ticket):
+            self.dropped += 1
+            logging.info(f"Anfrage in Channel {channel_id} wird von einer neueren ersetzt")
+            yield False
+            return
+
+        # Läuft noch eine Generierung für den Channel, wird auf sie gewartet
+        async with self._locks.setdefault(channel_id, asyncio.Lock()):
+
+            if not self._is_latest(channel_id, ticket):
+                self.dropped += 1
+                logging.info(f"Anfrage in Channel {channel_id} wird von einer neueren ersetzt")
+                yield False
+                return
+
+            yield True
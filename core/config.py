@@ -3,7 +3,7 @@ import logging
 from dotenv import load_dotenv
 import os
 
-from typing import Literal, List
+from typing import Literal, List, Dict
 
 load_dotenv()
 
@@ -58,6 +58,22 @@ class Config:
             return []
         return [tag.strip() for tag in value.split(",") if tag.strip()]
 
+    @staticmethod
+    def extract_weights(value: str | None) -> Dict[str, float]:
+        if not value:
+            return {}
+
+        weights = {}
+        for item in value.split(","):
+            if not item.strip():
+                continue
+            key, _, weight = item.partition(":")
+            try:
+                weights[key.strip()] = float(weight)
+            except ValueError:
+                raise ValueError(f"Ungültiges Gewicht: {item}")
+        return weights
+
 
 
     LOGLEVEL: int = extract_loglevel(os.getenv("LOGLEVEL", "INFO"))
@@ -69,24 +85,66 @@ class Config:
     MISTRAL_API_KEY: str|None = os.getenv("MISTRAL_API_KEY")
     MISTRAL_MODEL: str = os.getenv("MISTRAL_MODEL", "mistral-small-latest")
 
-    OLLAMA_URL: str = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    OLLAMA_URLS: List[str] = extract_csv_tags(os.getenv("OLLAMA_URL", "http://localhost:11434"))
+    OLLAMA_URL: str = OLLAMA_URLS[0] if OLLAMA_URLS else "http://localhost:11434"
+    OLLAMA_HEALTH_INTERVAL: float = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 10))
+    OLLAMA_STICKY_ROUTING: bool = os.getenv("OLLAMA_STICKY_ROUTING", "true").lower() == "true"
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "gemma3:4b")
     OLLAMA_MODEL_TEMPERATURE: float|None = float(value) if (value := os.getenv("OLLAMA_MODEL_TEMPERATURE")) else None
     OLLAMA_THINK: bool|Literal["low", "medium", "high"]|None = extract_ollama_think(os.getenv("OLLAMA_THINK"))
-    OLLAMA_KEEP_ALIVE: str|float|None = os.getenv("OLLAMA_KEEP_ALIVE")
+    OLLAMA_KEEP_ALIVE: str|float|None = extract_ollama_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE"))
+    OLLAMA_KEEP_ALIVE_MIN: float = float(os.getenv("OLLAMA_KEEP_ALIVE_MIN", 60))
+    OLLAMA_KEEP_ALIVE_MAX: float = float(os.getenv("OLLAMA_KEEP_ALIVE_MAX", 1800))
+    OLLAMA_KEEP_ALIVE_WINDOW: float = float(os.getenv("OLLAMA_KEEP_ALIVE_WINDOW", 3600))
+    OLLAMA_PRELOAD: bool = os.getenv("OLLAMA_PRELOAD", "true").lower() == "true"
+    RESIDENCY_UNLOAD_TAGS: List[str] = extract_csv_tags(os.getenv("RESIDENCY_UNLOAD_TAGS", "Image"))
     OLLAMA_TIMEOUT: float|None = float(value) if (value := os.getenv("OLLAMA_TIMEOUT")) else None
+    OLLAMA_MAX_CONNECTIONS: int = int(os.getenv("OLLAMA_MAX_CONNECTIONS", 32))
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", 8))
+    OLLAMA_KEEPALIVE_EXPIRY: float = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", 30))
+    OLLAMA_REQUIRED_VRAM: float = float(os.getenv("OLLAMA_REQUIRED_VRAM", 11))
     OLLAMA_IMAGE_MODEL: bool = os.getenv("OLLAMA_IMAGE_MODEL", "").lower() == "true"
     OLLAMA_IMAGE_MODEL_TYPES: List[str] = extract_csv_tags(os.getenv("OLLAMA_IMAGE_MODEL_TYPES", "image/jpeg,image/png"))
 
+    STREAM_RESPONSES: bool = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+    STREAM_UPDATE_INTERVAL: float = float(os.getenv("STREAM_UPDATE_INTERVAL", 1.5))
+
+    VRAM_BACKEND: Literal["nvml", "fake", "none"] = os.getenv("VRAM_BACKEND", "nvml").lower()
+    VRAM_FAKE_GB: List[float] = [float(gb) for gb in extract_csv_tags(os.getenv("VRAM_FAKE_GB", "24"))]
+    VRAM_TIMEOUT: float = float(os.getenv("VRAM_TIMEOUT", 20))
+    VRAM_POLL_INTERVAL: float = float(os.getenv("VRAM_POLL_INTERVAL", 2))
+
     TOOL_INTEGRATION: bool = os.getenv("TOOL_INTEGRATION", "").lower() == "true"
     MCP_SERVER_URL: str|None = os.getenv("MCP_SERVER_URL")
-    MCP_INTEGRATION_CLASS = os.getenv("MCP_INTEGRATION_CLASS", "providers.utils.mcp_integrations.base")
+    MCP_INTEGRATION_CLASS = os.getenv("MCP_INTEGRATION_CLASS", "MCPIntegration")
+    MCP_MAX_SESSIONS: int = int(os.getenv("MCP_MAX_SESSIONS", 4))
+    MCP_RECONNECT_ATTEMPTS: int = int(os.getenv("MCP_RECONNECT_ATTEMPTS", 5))
+    MCP_RECONNECT_MAX_DELAY: float = float(os.getenv("MCP_RECONNECT_MAX_DELAY", 30))
+    MCP_TOOL_CONCURRENCY: int = int(os.getenv("MCP_TOOL_CONCURRENCY", 4))
+    MCP_TOOL_RESULT_CACHE: bool = os.getenv("MCP_TOOL_RESULT_CACHE", "").lower() == "true"
+    MCP_TOOL_RESULT_CACHE_TTL: float = float(os.getenv("MCP_TOOL_RESULT_CACHE_TTL", 60))
+    MCP_TOOL_RESULT_CACHE_SIZE: int = int(os.getenv("MCP_TOOL_RESULT_CACHE_SIZE", 256))
+    MCP_TOOL_CATALOG_TTL: float = float(os.getenv("MCP_TOOL_CATALOG_TTL", 300))
     MCP_TOOL_TAGS: List[str] = extract_csv_tags(os.getenv("MCP_TOOL_TAGS"))
     MCP_ERROR_HELP_DISCORD_ID: int | None = int(value) if (value := os.getenv("MCP_ERROR_HELP_DISCORD_ID")) else None
 
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", 64000))
-    MAX_MESSAGE_COUNT: int = int(os.getenv("MAX_MESSAGE_COUNT", 3))
-    TOTAL_MESSAGE_SEARCH_COUNT: int = int(os.getenv("TOTAL_MESSAGE_SEARCH_COUNT", 20))
+    HISTORY_TRIM_MODE: Literal["window", "reset"] = os.getenv("HISTORY_TRIM_MODE", "window").lower()
+    MAX_MESSAGE_COUNT: int = int(os.getenv("MAX_MESSAGE_COUNT", 50))
+    TOTAL_MESSAGE_SEARCH_COUNT: int = int(os.getenv("TOTAL_MESSAGE_SEARCH_COUNT", 100))
+    CHAT_STORE_CAPACITY: int = int(os.getenv("CHAT_STORE_CAPACITY", 100))
+    CHAT_STORE_PATH: str|None = os.getenv("CHAT_STORE_PATH", "chats.sqlite3") or None
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+    TIKTOKEN_CACHE_DIR: str|None = os.getenv("TIKTOKEN_CACHE_DIR", "cache/tiktoken") or None
+    ATTACHMENT_MAX_BYTES: int = int(os.getenv("ATTACHMENT_MAX_BYTES", 256 * 1024))
+    ATTACHMENT_MAX_TOKENS: int = int(os.getenv("ATTACHMENT_MAX_TOKENS", 8000))
+    ATTACHMENT_CACHE_SIZE: int = int(os.getenv("ATTACHMENT_CACHE_SIZE", 32 * 1024 * 1024))
+    MEDIA_DIRECTORY: str = os.getenv("MEDIA_DIRECTORY", "downloads")
+    MEDIA_MAX_AGE: float = float(os.getenv("MEDIA_MAX_AGE", 7 * 24 * 3600))
+    MEDIA_MAX_SIZE: int = int(os.getenv("MEDIA_MAX_SIZE", 1024 ** 3))
+    RESPONSE_CACHE: bool = os.getenv("RESPONSE_CACHE", "").lower() == "true"
+    RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", 512))
     MAX_TOOL_CALLS: int = int(os.getenv("MAX_TOOL_CALLS", 30))
     DENY_RECURSIVE_TOOL_CALLING: bool = os.getenv("DENY_RECURSIVE_TOOL_CALLING", "").lower() == "true"
 
@@ -95,6 +153,13 @@ class Config:
     LANGUAGE: Literal["de", "en"] = os.getenv("LANGUAGE", "de")
     DISCORD_ID: int|None = int(value) if (value := os.getenv("DISCORD_ID")) else None
     USERNAMES_CSV_FILE_PATH: str|None = os.getenv("USERNAMES_PATH")
+    ROSTER_MAX_TOKENS: int = int(os.getenv("ROSTER_MAX_TOKENS", 1500))
+    MEMBER_PRESENCES: bool = os.getenv("MEMBER_PRESENCES", "true").lower() == "true"
+    GENERATION_CONCURRENCY: int = int(os.getenv("GENERATION_CONCURRENCY", 2))
+    SCHEDULER_WEIGHTS: Dict[str, float] = extract_weights(os.getenv("SCHEDULER_WEIGHTS"))
+    SCHEDULER_PRIORITY_DMS: bool = os.getenv("SCHEDULER_PRIORITY_DMS", "true").lower() == "true"
+    SCHEDULER_PRIORITY_ROLES: List[int] = [int(role) for role in extract_csv_tags(os.getenv("SCHEDULER_PRIORITY_ROLES"))]
+    COALESCE_WINDOW: float = float(os.getenv("COALESCE_WINDOW", 1.0))
     HISTORY_RESET_TEXT: str = os.getenv("HISTORY_RESET_TEXT", " --- ")
 
     COMMAND_NAME: str = os.getenv("COMMAND_NAME", "bot")
@@ -3,15 +3,18 @@ import traceback
 from enum import StrEnum
 
 import discord
-from fastmcp import Client
 
 from core.config import Config
+from providers.utils.mcp_session_pool import mcp_session_pool
 
 
 class BotActions(StrEnum):
     INTERRUPT = "interrupt_image_generation"
     UNLOAD_COMFY = "unload_comfy_models"
     RESET = "reset"
+    MODEL_STATUS = "model_status"
+    MODEL_LOAD = "load_model"
+    MODEL_UNLOAD = "unload_model"
 
 
 WORKER_SERVICE = os.getenv("WORKER_SERVICE", "emanuel")
@@ -23,8 +26,7 @@ class BotAction:
         try:
             match action:
                 case BotActions.INTERRUPT:
-                    client = Client(Config.MCP_SERVER_URL)
-                    async with client:
+                    async with mcp_session_pool.session() as client:
                         try:
                             await client.call_tool("interrupt_image_generation", {})
                             return "🛑 Generierung abgebrochen"
@@ -32,14 +34,31 @@ class BotAction:
                             return f"❌ Ausnahmefehler: {str(e)}"
 
                 case BotActions.UNLOAD_COMFY:
-                    client = Client(Config.MCP_SERVER_URL)
-                    async with client:
+                    async with mcp_session_pool.session() as client:
                         try:
                             await client.call_tool("free_image_generation_vram", {})
                             return "✅ Modelle werden entladen"
                         except Exception as e:
                             return f"❌ Ausnahmefehler: {str(e)}"
 
+                case BotActions.MODEL_STATUS | BotActions.MODEL_LOAD | BotActions.MODEL_UNLOAD if Config.AI != "ollama":
+                    return "❌ Nur mit Ollama verfügbar"
+
+                case BotActions.MODEL_STATUS:
+                    from providers.utils.residency import residency_manager
+                    return f"📊 Modellstatus:\n{await residency_manager.status()}"
+
+                case BotActions.MODEL_LOAD:
+                    from providers.utils.residency import residency_manager
+                    # Das Laden dauert länger als Discord auf eine Antwort wartet
+                    residency_manager.warm_up()
+                    return f"✅ {Config.OLLAMA_MODEL} wird geladen"
+
+                case BotActions.MODEL_UNLOAD:
+                    from providers.utils.residency import residency_manager
+                    unloaded = await residency_manager.unload()
+                    return f"✅ {Config.OLLAMA_MODEL} auf {unloaded} Host(s) entladen"
+
                 case BotActions.RESET:
                     await interaction.channel.send(Config.HISTORY_RESET_TEXT)
                     return f"✅ {Config.NAME} hat alles vergessen"
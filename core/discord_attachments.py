@@ -0,0 +1,111 @@
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict
+
+import aiohttp
+import discord
+
+from core.config import Config
+from providers.utils.tokenizer import get_tokenizer
+
+
+@dataclass
+class TextAttachment:
+    text: str
+    tokens: int
+    truncated: bool
+
+    @property
+    def size(self) -> int:
+        return len(self.text.encode("utf-8"))
+
+
+class TextAttachmentCache:
+    """LRU Cache für ausgelesene Text-Anhänge, begrenzt durch die Gesamtgröße der gespeicherten Texte.
+    Anhänge werden nur bis zu einer maximalen Byte- bzw. Tokenanzahl gelesen."""
+
+    def __init__(self, max_bytes: int, max_tokens: int, cache_size: int, chunk_size: int = 64 * 1024):
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self.chunk_size = chunk_size
+        self._cache: OrderedDict[int, TextAttachment] = OrderedDict()
+        self._cached_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    async def read(self, attachment: discord.Attachment) -> TextAttachment:
+
+        cached = self._cache.get(attachment.id)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(attachment.id)
+            return cached
+
+        self.misses += 1
+
+        data = await self._download(attachment)
+        truncated = len(data) < attachment.size
+        text = data.decode("utf-8", errors="replace" if not truncated else "ignore")
+
+        tokenizer = get_tokenizer()
+        tokens = tokenizer.encode(text)
+        if len(tokens) > self.max_tokens:
+            tokens = tokens[:self.max_tokens]
+            text = tokenizer.decode(tokens)
+            truncated = True
+
+        result = TextAttachment(text=text, tokens=len(tokens), truncated=truncated)
+
+        if truncated:
+            logging.info(f"Anhang {attachment.filename} gekürzt auf {result.size} Bytes / {result.tokens} Tokens")
+
+        self._store(attachment.id, result)
+
+        return result
+
+    async def _download(self, attachment: discord.Attachment) -> bytes:
+
+        if attachment.size <= self.max_bytes:
+            return await attachment.read()
+
+        # Große Dateien nur bis zur Grenze streamen statt komplett herunterzuladen
+        data = bytearray()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(attachment.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    data.extend(chunk)
+                    if len(data) >= self.max_bytes:
+                        break
+
+        return bytes(data[:self.max_bytes])
+
+    def _store(self, attachment_id: int, result: TextAttachment):
+
+        if result.size > self.cache_size:
+            return
+
+        self._cache[attachment_id] = result
+        self._cached_bytes += result.size
+
+        while self._cached_bytes > self.cache_size:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._cache),
+            "bytes": self._cached_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+text_attachment_cache = TextAttachmentCache(
+    max_bytes=Config.ATTACHMENT_MAX_BYTES,
+    max_tokens=Config.ATTACHMENT_MAX_TOKENS,
+    cache_size=Config.ATTACHMENT_CACHE_SIZE,
+)
@@ -0,0 +1,177 @@
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Deque
+
+import discord
+import pytz
+
+from core.config import Config
+from core.discord_attachments import text_attachment_cache
+from core.media_store import media_store
+
+
+@dataclass
+class BufferedMessage:
+    message: discord.Message
+    entry: Dict | None = None  # Formatierter Verlaufseintrag, wird beim ersten Gebrauch erzeugt
+    formatted: bool = False
+
+
+async def format_message(msg: discord.Message, bot_user: discord.ClientUser) -> Dict | None:
+
+    role = "assistant" if msg.author == bot_user else "user"
+    timestamp = msg.created_at.astimezone(pytz.timezone("Europe/Berlin")).strftime("%H:%M:%S")
+    content = msg.content if msg.author == bot_user else f"<#Nachricht von <@{msg.author.id}> um {timestamp}> {msg.content}"
+    images = []
+
+    if msg.attachments:
+        for attachment in msg.attachments:
+
+            if attachment.content_type and Config.AI == "ollama" and Config.OLLAMA_IMAGE_MODEL and attachment.content_type in Config.OLLAMA_IMAGE_MODEL_TYPES: # TODO Modularize + Language Options
+                image_bytes = await attachment.read()
+
+                save_path = await media_store.put(image_bytes, os.path.splitext(attachment.filename)[1])
+
+                images.append(save_path)
+
+                content += f"\n<#Bildname: {attachment.filename}>"
+            elif attachment.content_type and "text" in attachment.content_type:
+                text_attachment = await text_attachment_cache.read(attachment)
+
+                content += f"\n<#Dateiname: {attachment.filename}, ausgelesener Inhalt folgt:>\n{text_attachment.text}"
+                if text_attachment.truncated:
+                    content += f"\n<#Inhalt gekürzt, die Datei ist {attachment.size} Bytes groß>"
+            else:
+                content += f"\n<#Dateiname: {attachment.filename}>"
+
+    if not content and not images:
+        return None
+
+    return {"role": role, "content": content, **({"images": images} if images else {})}
+
+
+class DiscordHistoryCache:
+    """Ringpuffer der letzten Nachrichten pro Channel, der über die Gateway Events aktuell gehalten wird.
+    Ein Channel wird erst beim ersten Gebrauch einmalig über die REST API befüllt, danach nur noch über Events."""
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self.channels: Dict[int, Deque[BufferedMessage]] = {}
+        self.resets: Dict[int, int] = {}  # Channel ID -> ID der letzten Reset Nachricht
+
+    def add(self, message: discord.Message):
+
+        buffer = self.channels.get(message.channel.id)
+        if buffer is None:
+            return
+
+        if message.content == Config.HISTORY_RESET_TEXT:
+            buffer.clear()
+            self.resets[message.channel.id] = message.id
+            return
+
+        buffer.append(BufferedMessage(message))
+
+    def edit(self, message: discord.Message):
+
+        buffer = self.channels.get(message.channel.id)
+        if buffer is None:
+            return
+
+        for i, buffered in enumerate(buffer):
+            if buffered.message.id == message.id:
+                if message.content == Config.HISTORY_RESET_TEXT:
+                    for _ in range(i + 1):
+                        buffer.popleft()
+                    self.resets[message.channel.id] = message.id
+                else:
+                    buffer[i] = BufferedMessage(message)
+                return
+
+    def delete(self, channel_id: int, message_id: int):
+        """Arbeitet nur mit IDs, da gelöschte Nachrichten meist nicht im Nachrichten Cache von discord.py liegen"""
+
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            return
+
+        if self.resets.get(channel_id) == message_id:
+            # Ältere Nachrichten werden wieder relevant -> beim nächsten Gebrauch neu laden
+            self.channels.pop(channel_id, None)
+            self.resets.pop(channel_id, None)
+            return
+
+        for buffered in buffer:
+            if buffered.message.id == message_id:
+                buffer.remove(buffered)
+                return
+
+    def recent_authors(self, channel_id: int) -> List[discord.abc.User]:
+        """Verfasser der gepufferten Nachrichten, die neuesten zuerst"""
+
+        authors = {}
+        for buffered in reversed(self.channels.get(channel_id, ())):
+            authors.setdefault(buffered.message.author.id, buffered.message.author)
+        return list(authors.values())
+
+    def activity_ranking(self, channel_id: int) -> List[int]:
+        """IDs der zuletzt aktiven und erwähnten Nutzer, die neuesten zuerst"""
+
+        ranking = {}
+        for buffered in reversed(self.channels.get(channel_id, ())):
+            ranking.setdefault(buffered.message.author.id, None)
+            for user_id in buffered.message.raw_mentions:
+                ranking.setdefault(user_id, None)
+        return list(ranking)
+
+    async def get_history(self, channel: discord.abc.Messageable, bot_user: discord.ClientUser) -> List[Dict]:
+
+        buffer = self.channels.get(channel.id)
+        if buffer is None:
+            buffer = await self._fill(channel)
+
+        history = []
+        for buffered in reversed(list(buffer)):  # Kopie, da während des Formatierens neue Nachrichten eintreffen können
+
+            if len(history) >= Config.MAX_MESSAGE_COUNT:
+                break
+
+            # Bereits formatierte Bilder werden erneut gespeichert, falls sie inzwischen aufgeräumt wurden
+            if buffered.formatted and buffered.entry and media_store.refresh(buffered.entry.get("images", ())):
+                buffered.formatted = False
+
+            if not buffered.formatted:
+                buffered.entry = await format_message(buffered.message, bot_user)
+                buffered.formatted = True
+
+            if buffered.entry is not None:
+                history.append(buffered.entry)
+
+        history.reverse()
+
+        return history
+
+    async def _fill(self, channel: discord.abc.Messageable) -> Deque[BufferedMessage]:
+
+        logging.info(f"Nachrichtenverlauf für Channel {channel.id} wird geladen")
+
+        # Der Puffer wird sofort angelegt, damit währenddessen eintreffende Nachrichten nicht verloren gehen
+        buffer = deque(maxlen=self.maxlen)
+        self.channels[channel.id] = buffer
+
+        fetched = []
+        async for msg in channel.history(limit=self.maxlen, oldest_first=False):
+            if msg.content == Config.HISTORY_RESET_TEXT:
+                self.resets[channel.id] = msg.id
+                break
+            fetched.append(msg)
+
+        messages = {msg.id: msg for msg in fetched}
+        messages.update({buffered.message.id: buffered.message for buffered in buffer})
+
+        buffer.clear()
+        buffer.extend(BufferedMessage(messages[message_id]) for message_id in sorted(messages))
+
+        return buffer
@@ -37,6 +37,11 @@ class DiscordMessageTmpProtocol(Protocol):
 class DiscordMessageReplyTmp(DiscordMessageReply, DiscordMessageTmpMixin):
     embed: bool = True
 
+@dataclass(kw_only=True)
+class DiscordMessageStreamTmp(DiscordMessageReplyTmp):
+    key: str = "stream"
+    embed: bool = False
+
 @dataclass(kw_only=True)
 class DiscordMessageFileTmp(DiscordMessageFile, DiscordMessageTmpMixin):
     key: str = "progress"
@@ -11,8 +11,9 @@ def use_help_bot(message: discord.Message):
 
         logging.debug("DISCORD HELP BOT: Discord Text Channel - check if the Help Bot should be used")
 
-        logging.debug("DISCORD HELP BOT: %s", [member.id for member in message.channel.members])
-        is_member = Config.MCP_ERROR_HELP_DISCORD_ID in [member.id for member in message.channel.members]
+        # Direkter Lookup statt alle Mitglieder des Channels zu durchsuchen
+        member = message.guild.get_member(Config.MCP_ERROR_HELP_DISCORD_ID) if Config.MCP_ERROR_HELP_DISCORD_ID else None
+        is_member = member is not None and message.channel.permissions_for(member).read_messages
 
         logging.debug(f"DISCORD HELP BOT: Is {Config.MCP_ERROR_HELP_DISCORD_ID} member: {is_member}")
 
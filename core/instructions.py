@@ -1,19 +1,20 @@
-import csv
+import functools
 import logging
-import os
-from typing import List, Dict
+from typing import List, Dict, Sequence
 
 import discord
-from discord import Status
 
 from core.config import Config
+from core.usernames import usernames_cache
+from providers.utils.tokenizer import get_tokenizer
 
 
-def get_instructions_from_discord_info(message: discord.Message) -> str:
+async def get_instructions_from_discord_info(message: discord.Message, members: List[discord.Member], ranking: Sequence[int] = ()) -> str:
 
     if not isinstance(message.channel, discord.DMChannel):
 
-        member_list = get_member_list(message.channel.members)
+        # Der Verfasser der Nachricht steht immer an erster Stelle
+        member_list = await get_member_list(members, [message.author.id, *ranking], Config.ROSTER_MAX_TOKENS)
         member_list = "\n".join([f" - {m}" for m in member_list])
 
         logging.info(member_list)
@@ -57,16 +58,42 @@ Do not modify the format, and make sure to include the angle brackets and the nu
     return instructions
 
 
-def get_member_list(members: List[discord.Member]) -> List[Dict[str, str | int]]:
+@functools.lru_cache(maxsize=4096)
+def count_roster_line_tokens(line: str) -> int:
+    return len(get_tokenizer().encode(line)) + 1
 
-    member_dict = {m.id: {"Discord": m.display_name, "Discord ID": m.id} for m in members if m.status in [Status.online, Status.idle]}
-    extra_dict = {}
-    if Config.USERNAMES_CSV_FILE_PATH and os.path.exists(Config.USERNAMES_CSV_FILE_PATH):
-        with open(Config.USERNAMES_CSV_FILE_PATH, 'r', encoding='utf-8') as datei:
-            csv_reader = csv.DictReader(datei)
-            extra_dict = {int(row["Discord ID"]): {**row, "Discord ID": int(row["Discord ID"])} for row in csv_reader}
 
-    return [
-        { **extra_dict.get(key, {}), **member_dict.get(key, {}) }
-        for key in (member_dict.keys() | extra_dict.keys())
-    ]
\ No newline at end of file
+async def get_member_list(members: List[discord.Member], ranking: Sequence[int] = (), max_tokens: int = 0) -> List[Dict[str, str | int]]:
+    """Die übergebenen Mitglieder sind bereits auf Online bzw. kürzlich aktive Mitglieder eingeschränkt.
+    Bei einem Token Budget werden die Mitglieder nach ihrer Position im Ranking (Aktivität, Erwähnungen) ausgewählt
+    und anschließend nach ID sortiert, damit die Liste bei gleicher Auswahl identisch bleibt."""
+
+    extra_dict = await usernames_cache.get()
+
+    member_dict = {
+        m.id: {**extra_dict.get(m.id, {}), "Discord": m.display_name, "Discord ID": m.id}
+        for m in members
+    }
+
+    member_list = [*member_dict.values(), *(row for key, row in extra_dict.items() if key not in member_dict)]
+
+    if not max_tokens:
+        return sorted(member_list, key=lambda m: m["Discord ID"])
+
+    rank = {member_id: i for i, member_id in reversed(list(enumerate(ranking)))}
+    # Die ID als zweiter Schlüssel hält die Auswahl bei gleichem Rang unabhängig von der Reihenfolge der Mitglieder
+    ranked = sorted(member_list, key=lambda m: (rank.get(m["Discord ID"], len(rank)), m["Discord ID"]))
+
+    selected = []
+    used_tokens = 0
+    total_tokens = 0
+    for member in ranked:
+        tokens = count_roster_line_tokens(f" - {member}")
+        total_tokens += tokens
+        if used_tokens + tokens <= max_tokens or not selected:
+            selected.append(member)
+            used_tokens += tokens
+
+    logging.info(f"Mitgliederliste: {len(selected)} von {len(member_list)} Mitgliedern, {total_tokens - used_tokens} von {total_tokens} Tokens gespart")
+
+    return sorted(selected, key=lambda m: m["Discord ID"])
\ No newline at end of file
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Iterable, List
+
+from core.config import Config
+
+
+class MediaStore:
+    """Inhaltsadressierter Speicher für Bilder und andere Medien.
+    Dateien werden nach ihrem Hash benannt, außerhalb des Event Loops geschrieben und nach Alter und Gesamtgröße aufgeräumt."""
+
+    def __init__(self, directory: str, max_age: float, max_size: int, gc_interval: float = 3600):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_size = max_size
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        self._gc_task: asyncio.Task | None = None
+
+    async def put(self, data: bytes, ext: str = "") -> str:
+        """Speichert die Daten, falls noch nicht vorhanden, und gibt den Pfad zurück"""
+
+        path = await asyncio.to_thread(self._write, data, ext)
+
+        if time.monotonic() - self._last_gc >= self.gc_interval and not (self._gc_task and not self._gc_task.done()):
+            self._last_gc = time.monotonic()
+            self._gc_task = asyncio.create_task(asyncio.to_thread(self.collect_garbage))
+
+        return path
+
+    def _write(self, data: bytes, ext: str) -> str:
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, f"{digest}{ext.lower()}")
+
+        if os.path.exists(path):
+            os.utime(path)  # Als kürzlich benutzt markieren
+            return path
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        return path
+
+    @staticmethod
+    def refresh(paths: Iterable[str]) -> List[str]:
+        """Markiert weiterhin benutzte Dateien als kürzlich benutzt, damit sie nicht aufgeräumt werden.
+        Gibt die Pfade zurück, die bereits entfernt wurden."""
+
+        missing = []
+        for path in paths:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                missing.append(path)
+        return missing
+
+    def collect_garbage(self):
+
+        now = time.time()
+        files = []
+
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+
+        removed = 0
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry.path)
+                removed += 1
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+
+        logging.info(f"Media Store aufgeräumt: {removed} Dateien entfernt, {total} Bytes belegt")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+media_store = MediaStore(
+    directory=Config.MEDIA_DIRECTORY,
+    max_age=Config.MEDIA_MAX_AGE,
+    max_size=Config.MEDIA_MAX_SIZE,
+)
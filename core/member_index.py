@@ -0,0 +1,53 @@
+import logging
+from typing import Dict, List, Iterable
+
+import discord
+from discord import Status
+
+ONLINE_STATUSES = (Status.online, Status.idle)
+
+
+class MemberIndex:
+    """Online und abwesende Mitglieder pro Guild, aktuell gehalten über Presence und Member Events,
+    damit nicht bei jeder Nachricht alle Mitglieder eines Channels durchsucht werden müssen.
+    Ohne Presence Intent wird die Liste stattdessen aus den letzten Verfassern im Channel gebildet."""
+
+    def __init__(self, presences: bool):
+        self.presences = presences
+        self.online: Dict[int, Dict[int, None]] = {}  # Guild ID -> geordnete Menge der Member IDs
+
+    def seed(self, guilds: Iterable[discord.Guild]):
+        if not self.presences:
+            return
+        for guild in guilds:
+            self.online[guild.id] = {m.id: None for m in guild.members if m.status in ONLINE_STATUSES}
+            logging.info(f"Member Index für {guild.name}: {len(self.online[guild.id])} Mitglieder online")
+
+    def update(self, member: discord.Member):
+        if not self.presences:
+            return
+        online = self.online.setdefault(member.guild.id, {})
+        if member.status in ONLINE_STATUSES:
+            online[member.id] = None
+        else:
+            online.pop(member.id, None)
+
+    def remove(self, member: discord.Member):
+        self.online.get(member.guild.id, {}).pop(member.id, None)
+
+    def roster(self, channel: discord.abc.GuildChannel, recent_authors: Iterable[discord.abc.User] = ()) -> List[discord.Member]:
+        """Mitglieder, die den Channel lesen können und online sind bzw. ohne Presence Intent zuletzt geschrieben haben"""
+
+        guild = channel.guild
+
+        if self.presences:
+            members = (guild.get_member(member_id) for member_id in self.online.get(guild.id, {}))
+        else:
+            members = (guild.get_member(author.id) for author in recent_authors)
+
+        roster = {}
+        for member in members:
+            if member is not None and member.id not in roster and channel.permissions_for(member).read_messages:
+                roster[member.id] = member
+
+        return list(roster.values())
@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Callable, AsyncIterator, Tuple
+
+import discord
+
+from core.config import Config
+
+
+@dataclass(order=True)
+class QueuedGeneration:
+    priority: int
+    finish_tag: float
+    seq: int
+    flow: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+    on_position: Callable[[int], None] | None = field(compare=False, default=None)
+    position: int = field(compare=False, default=0)
+
+
+class GenerationScheduler:
+    """Begrenzt die Anzahl gleichzeitiger Generierungen und verteilt freie Plätze fair auf Guilds und Channels.
+    Weighted Fair Queuing: jede Anfrage bekommt einen virtuellen Endzeitpunkt abhängig vom Gewicht ihres Flows.
+    Anfragen mit Priorität (DMs, konfigurierte Rollen) werden immer zuerst bedient."""
+
+    def __init__(self, concurrency: int, weights: Dict[str, float]):
+        self.concurrency = concurrency
+        self.weights = weights
+        self._queue: List[QueuedGeneration] = []
+        self._running = 0
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, flow: str, priority: bool = False, on_position: Callable[[int], None] | None = None) -> AsyncIterator[None]:
+        """Wartet auf einen freien Platz. on_position bekommt die Warteschlangenposition, 0 sobald die Generierung startet."""
+
+        if self._running < self.concurrency and not self._queue:
+            self._running += 1
+            self._record_wait(0.0)
+        else:
+            await self._wait(flow, priority, on_position)
+
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+    async def _wait(self, flow: str, priority: bool, on_position: Callable[[int], None] | None):
+
+        start = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        finish_tag = start + 1 / self.weights.get(flow, 1.0)
+        self._last_finish[flow] = finish_tag
+        self._seq += 1
+
+        queued = QueuedGeneration(
+            priority=0 if priority else 1,
+            finish_tag=finish_tag,
+            seq=self._seq,
+            flow=flow,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued=time.monotonic(),
+            on_position=on_position,
+        )
+        heapq.heappush(self._queue, queued)
+        self._notify_positions()
+
+        try:
+            await queued.future
+        except asyncio.CancelledError:
+            if queued.future.done() and not queued.future.cancelled():
+                # Der Platz wurde bereits vergeben -> wieder freigeben
+                self._running -= 1
+                self._dispatch()
+            else:
+                self._queue.remove(queued)
+                heapq.heapify(self._queue)
+                self._notify_positions()
+            raise
+
+    def _dispatch(self):
+
+        dispatched = False
+
+        while self._running < self.concurrency and self._queue:
+            queued = heapq.heappop(self._queue)
+            self._virtual_time = max(self._virtual_time, queued.finish_tag)
+            self._running += 1
+            self._record_wait(time.monotonic() - queued.enqueued)
+            queued.future.set_result(None)
+            if queued.on_position:
+                queued.on_position(0)
+            dispatched = True
+
+        if dispatched:
+            self._notify_positions()
+
+    def _notify_positions(self):
+        for position, queued in enumerate(sorted(self._queue), start=1):
+            if queued.on_position and queued.position != position:
+                queued.position = position
+                queued.on_position(position)
+
+    def _record_wait(self, wait: float):
+        self.served += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait:
+            logging.info(f"Generierung nach {wait:.1f}s Wartezeit gestartet: {self.stats()}")
+
+    def stats(self) -> Dict[str, int | float]:
+        return {
+            "queue_depth": len(self._queue),
+            "running": self._running,
+            "served": self.served,
+            "average_wait": self.total_wait / self.served if self.served else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+def generation_flow(message: discord.Message) -> Tuple[str, bool]:
+    """Flow (Guild bzw. DM Channel) und Priorität einer Nachricht für den Scheduler"""
+
+    if isinstance(message.channel, discord.DMChannel) or message.guild is None:
+        return f"dm:{message.channel.id}", Config.SCHEDULER_PRIORITY_DMS
+
+    roles = getattr(message.author, "roles", [])
+    priority = any(role.id in Config.SCHEDULER_PRIORITY_ROLES for role in roles)
+
+    flow = str(message.channel.id) if str(message.channel.id) in Config.SCHEDULER_WEIGHTS else str(message.guild.id)
+
+    return flow, priority
+
+
+generation_scheduler = GenerationScheduler(concurrency=Config.GENERATION_CONCURRENCY, weights=Config.SCHEDULER_WEIGHTS)
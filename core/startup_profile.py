@@ -0,0 +1,37 @@
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import List, Tuple, Iterator
+
+
+class StartupProfiler:
+    """Misst die Dauer der einzelnen Startschritte, aktiviert mit --startup-profile"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def report(self) -> str:
+        width = max((len(name) for name, _ in self.steps), default=0)
+        lines = [f"  {name:<{width}}  {duration * 1000:8.1f} ms" for name, duration in self.steps]
+        lines.append(f"  {'total':<{width}}  {(time.perf_counter() - self.start) * 1000:8.1f} ms")
+        return "⏱️ Startup Profile:\n" + "\n".join(lines)
+
+    def print_report(self):
+        if self.enabled:
+            report = self.report()
+            print(report)
+            logging.info(report)
+
+
+startup_profiler = StartupProfiler(enabled="--startup-profile" in sys.argv)
@@ -0,0 +1,52 @@
+import asyncio
+import csv
+import logging
+import os
+from typing import Dict, Tuple
+
+from core.config import Config
+
+
+class UsernamesCache:
+    """Die Nutzer CSV indexiert nach Discord ID.
+    Die Datei wird nur neu eingelesen, wenn sich ihre Änderungszeit ändert, und das außerhalb des Event Loops."""
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.users: Dict[int, Dict] = {}
+        self._version: Tuple[int, int] | None = None
+        self._lock = asyncio.Lock()
+
+    def _stat(self) -> Tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    async def get(self) -> Dict[int, Dict]:
+
+        if not self.path:
+            return {}
+
+        version = self._stat()
+        if version == self._version:
+            return self.users
+
+        async with self._lock:
+
+            version = self._stat()
+            if version != self._version:
+                self.users = await asyncio.to_thread(self._load) if version else {}
+                self._version = version
+                logging.info(f"Nutzer CSV geladen: {len(self.users)} Einträge")
+
+        return self.users
+
+    def _load(self) -> Dict[int, Dict]:
+        with open(self.path, 'r', encoding='utf-8') as datei:
+            csv_reader = csv.DictReader(datei)
+            return {int(row["Discord ID"]): {**row, "Discord ID": int(row["Discord ID"])} for row in csv_reader}
+
+
+usernames_cache = UsernamesCache(Config.USERNAMES_CSV_FILE_PATH)
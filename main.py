@@ -3,22 +3,28 @@ import io
 import logging
 from typing import List, Dict
 
-import discord
-import pytz
-from discord.ext import commands
-from dotenv import load_dotenv
-import os
-
-from core.config import Config
-from core.external_help_bot import use_help_bot
-from core.instructions import get_instructions_from_discord_info
-from core.message_handling import clean_reply
-from core.logging_config import setup_logging
-from core.discord_buttons import ProgressButton
-from core.discord_messages import DiscordMessage, DiscordMessageFile, DiscordMessageReply, \
-    DiscordMessageTmpMixin, DiscordTemporaryMessagesController, DiscordMessageReplyTmpError
-from providers.mistral import MistralLLM
-from providers.ollama import OllamaLLM
+from core.startup_profile import startup_profiler
+
+with startup_profiler.step("import discord"):
+    import discord
+    from discord.ext import commands
+    from dotenv import load_dotenv
+
+with startup_profiler.step("import core"):
+    from core.coalescing import ChannelCoalescer
+    from core.config import Config
+    from core.discord_history import DiscordHistoryCache
+    from core.external_help_bot import use_help_bot
+    from core.instructions import get_instructions_from_discord_info
+    from core.member_index import MemberIndex
+    from core.message_handling import clean_reply
+    from core.logging_config import setup_logging
+    from core.discord_buttons import ProgressButton
+    from core.discord_messages import DiscordMessage, DiscordMessageFile, DiscordMessageReply, \
+        DiscordMessageTmpMixin, DiscordTemporaryMessagesController, DiscordMessageReplyTmpError, DiscordMessageReplyTmp, \
+        DiscordMessageRemoveTmp
+    from core.scheduler import generation_scheduler, generation_flow
+    from providers.utils.system_prompt import SystemPrompt
 
 load_dotenv()
 
@@ -30,23 +36,47 @@ intents = discord.Intents.default()
 intents.message_content = True  # Für Textnachrichten lesen
 intents.messages = True
 intents.members = True
-intents.presences = True
+intents.presences = Config.MEMBER_PRESENCES  # Ohne Presence Events wird die Mitgliederliste aus den letzten Nachrichten gebildet
 
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+history_cache = DiscordHistoryCache(maxlen=Config.TOTAL_MESSAGE_SEARCH_COUNT)
 
+coalescer = ChannelCoalescer(window=Config.COALESCE_WINDOW)
+
+member_index = MemberIndex(presences=Config.MEMBER_PRESENCES)
+
+
+# Nur der konfigurierte Provider samt SDK wird importiert
 match Config.AI:
     case "ollama":
-        pass
-        llm = OllamaLLM()
+        with startup_profiler.step("import provider ollama"):
+            from providers.ollama import OllamaLLM
+        with startup_profiler.step("init provider ollama"):
+            llm = OllamaLLM()
     case "mistral":
-        pass
-        llm = MistralLLM()
+        with startup_profiler.step("import provider mistral"):
+            from providers.mistral import MistralLLM
+        with startup_profiler.step("init provider mistral"):
+            llm = MistralLLM()
+
+if startup_profiler.enabled:
+    from providers.utils.tokenizer import get_tokenizer
+    with startup_profiler.step("load tokenizer"):
+        get_tokenizer()
+
 
+async def call_ai(history: List[Dict], instructions: SystemPrompt, queue: asyncio.Queue[DiscordMessage|None], channel: str, use_help_bot: bool = True, flow: str = "default", priority: bool = False):
+
+    def show_queue_position(position: int):
+        if position:
+            queue.put_nowait(DiscordMessageReplyTmp(key="queue", value=f"⏳ Position {position} in der Warteschlange"))
+        else:
+            queue.put_nowait(DiscordMessageRemoveTmp(key="queue"))
 
-async def call_ai(history: List[Dict], instructions: str, queue: asyncio.Queue[DiscordMessage|None], channel: str, use_help_bot: bool = True):
     try:
-        await llm.call(history, instructions, queue, channel, use_help_bot)
+        async with generation_scheduler.slot(flow, priority, on_position=show_queue_position):
+            await llm.call(history, instructions, queue, channel, use_help_bot)
     except Exception as e:
         logging.exception(e, exc_info=True)
         await queue.put(DiscordMessageReplyTmpError(value=str(e)))
@@ -65,121 +95,98 @@ async def handle_message(message):
 
     if is_relevant_message(message):
 
-        async with message.channel.typing(), DiscordTemporaryMessagesController(channel=message.channel) as tmp_controller:
-
-            try:
-
-                queue = asyncio.Queue[DiscordMessage]()
-
-                async def listener(queue: asyncio.Queue[DiscordMessage|None]):
+        # Ein entladenes Modell wird schon während des Zusammenfassens wieder geladen
+        llm.on_activity()
 
-                    while True:
-                        try:
-                            event = await queue.get()
-                            if event is None:
-                                break
-                            if isinstance(event, DiscordMessageTmpMixin):
+        async with coalescer.coalesce(message.channel.id) as latest:
 
-                                view = None
-                                if event.cancelable:
-                                    view = ProgressButton()
+            if not latest:
+                return
 
-                                await tmp_controller.set_message(event, view)
+            await respond_to_message(message)
 
-                            elif isinstance(event, DiscordMessageFile):
 
-                                file = discord.File(io.BytesIO(event.value), filename=event.filename)
-                                await message.channel.send(file=file)
-
-                            elif isinstance(event, DiscordMessageReply):
-                                reply = clean_reply(event.value)
-                                if not reply:
-                                    return
-                                if len(reply) > 2000:
-                                    file = discord.File(io.BytesIO(reply.encode('utf-8')), filename=f"{bot.user.name}s Antwort.txt")
-                                    await message.channel.send(file=file)
-                                else:
-                                    await message.channel.send(reply)
-
-                            else:
-                                raise Exception("Ungültiger DiscordMessage Typ")
-
-                        except Exception as e:
-                            logging.exception(e, exc_info=True)
+async def respond_to_message(message: discord.Message):
 
+    async with message.channel.typing(), DiscordTemporaryMessagesController(channel=message.channel) as tmp_controller:
 
-                history = []
-                async for msg in message.channel.history(limit=Config.TOTAL_MESSAGE_SEARCH_COUNT, oldest_first=False):
+        try:
 
-                    if msg.content == Config.HISTORY_RESET_TEXT:
-                        break
+            queue = asyncio.Queue[DiscordMessage]()
 
-                    if len(history) >= Config.MAX_MESSAGE_COUNT:
-                        break
+            async def listener(queue: asyncio.Queue[DiscordMessage|None]):
 
-                    role = "assistant" if msg.author == bot.user else "user"
-                    timestamp = msg.created_at.astimezone(pytz.timezone("Europe/Berlin")).strftime("%H:%M:%S")
-                    content = msg.content if msg.author == bot.user else f"<#Nachricht von <@{msg.author.id}> um {timestamp}> {msg.content}"
-                    images = []
+                while True:
+                    try:
+                        event = await queue.get()
+                        if event is None:
+                            break
+                        if isinstance(event, DiscordMessageTmpMixin):
 
-                    if msg.attachments:
-                        for attachment in msg.attachments:
+                            view = None
+                            if event.cancelable:
+                                view = ProgressButton()
 
-                            if attachment.content_type and Config.AI == "ollama" and Config.OLLAMA_IMAGE_MODEL and attachment.content_type in Config.OLLAMA_IMAGE_MODEL_TYPES: # TODO Modularize + Language Options
-                                image_bytes = await attachment.read()
-                                image_filename = attachment.filename
+                            await tmp_controller.set_message(event, view)
 
-                                save_path = os.path.join("downloads", image_filename)
-                                os.makedirs("downloads", exist_ok=True)
+                        elif isinstance(event, DiscordMessageFile):
 
-                                with open(save_path, "wb") as f:
-                                    f.write(image_bytes)
+                            file = discord.File(io.BytesIO(event.value), filename=event.filename)
+                            await message.channel.send(file=file)
 
-                                images.append(save_path)
+                        elif isinstance(event, DiscordMessageReply):
+                            reply = clean_reply(event.value)
+                            if not reply:
+                                return
+                            if len(reply) > 2000:
+                                file = discord.File(io.BytesIO(reply.encode('utf-8')), filename=f"{bot.user.name}s Antwort.txt")
+                                await message.channel.send(file=file)
+                            else:
+                                await message.channel.send(reply)
 
-                                content += f"\n<#Bildname: {attachment.filename}>"
-                            elif attachment.content_type and "text" in attachment.content_type:
-                                text_bytes = await attachment.read()
-                                text_content = text_bytes.decode("utf-8")
+                        else:
+                            raise Exception("Ungültiger DiscordMessage Typ")
 
-                                content += f"\n<#Dateiname: {attachment.filename}, ausgelesener Inhalt folgt:>\n{text_content}"
-                            else:
-                                content += f"\n<#Dateiname: {attachment.filename}>"
+                    except Exception as e:
+                        logging.exception(e, exc_info=True)
 
-                    if not content and not images:
-                        continue
 
-                    history.append({"role": role, "content": content, **({"images": images} if images else {})})
+            history = await history_cache.get_history(message.channel, bot.user)
 
-                history.reverse() # Hoffentlich nicht
+            logging.info(history)
 
-                logging.info(history)
 
+            channel_name = message.author.display_name if isinstance(message.channel, discord.DMChannel) else message.channel.name
 
-                channel_name = message.author.display_name if isinstance(message.channel, discord.DMChannel) else message.channel.name
+            def replace_placeholders(text: str) -> str:
+                return text.replace("[#NAME]", Config.NAME).replace("[#DISCORD_ID]", str(Config.DISCORD_ID))
 
-                instructions = get_instructions_from_discord_info(message)
+            # Die flüchtigen Channel Infos stehen am Ende, damit der Präfix für den Prompt Cache stabil bleibt
+            members = member_index.roster(message.channel, history_cache.recent_authors(message.channel.id)) if message.guild else []
 
-                instructions += Config.INSTRUCTIONS
+            instructions = SystemPrompt.build(
+                instructions=replace_placeholders(Config.INSTRUCTIONS),
+                channel=replace_placeholders(await get_instructions_from_discord_info(message, members, history_cache.activity_ranking(message.channel.id))),
+            )
 
-                instructions = instructions.replace("[#NAME]", Config.NAME)
-                instructions = instructions.replace("[#DISCORD_ID]", str(Config.DISCORD_ID))
+            logging.info(instructions.render())
 
-                logging.info(instructions)
+            task1 = asyncio.create_task(listener(queue))
+            flow, priority = generation_flow(message)
 
-                task1 = asyncio.create_task(listener(queue))
-                task2 = asyncio.create_task(call_ai(history, instructions, queue, channel_name, use_help_bot(message)))
+            task2 = asyncio.create_task(call_ai(history, instructions, queue, channel_name, use_help_bot(message), flow, priority))
 
-                await asyncio.gather(task1, task2)
+            await asyncio.gather(task1, task2)
 
 
-            except Exception as e:
-                logging.error(e, exc_info=True)
-                await message.channel.send(str(e))
+        except Exception as e:
+            logging.error(e, exc_info=True)
+            await message.channel.send(str(e))
 
 
 @bot.event
 async def on_message(message: discord.Message):
+    history_cache.add(message)
     try:
         await handle_message(message)
     except Exception as e:
@@ -187,14 +194,52 @@ async def on_message(message: discord.Message):
         await message.reply(f"Fehler: {e}")
 
 
+# Raw Events, da per REST geladene Nachrichten nicht im Nachrichten Cache von discord.py liegen
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    history_cache.edit(payload.message)
+
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    history_cache.delete(payload.channel_id, payload.message_id)
+
+
+@bot.event
+async def on_presence_update(before: discord.Member, after: discord.Member):
+    member_index.update(after)
+
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    member_index.update(member)
+
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    member_index.remove(member)
+
+
 @bot.event
 async def on_ready():
     print(f"🤖 Bot online as {bot.user}!")
     # Alle Cogs laden
-    await bot.load_extension("cogs.commands")
-    await bot.tree.sync()
+    with startup_profiler.step("load extensions"):
+        await bot.load_extension("cogs.commands")
+    with startup_profiler.step("sync slash commands"):
+        await bot.tree.sync()
     print("✅ Slash-Commands synchronized")
 
+    member_index.seed(bot.guilds)
+
+    if Config.OLLAMA_PRELOAD:
+        asyncio.create_task(llm.preload())
+
+    startup_profiler.print_report()
+    startup_profiler.enabled = False
+
 
 
 bot.run(Config.DISCORD_TOKEN)
+
+llm.chats.close()
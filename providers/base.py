@@ -2,15 +2,22 @@ import asyncio
 import importlib
 import logging
 import pkgutil
+import time
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import List, Dict, Type
+from typing import List, Dict, Type, AsyncIterator
 
 from core.config import Config
-from core.discord_messages import DiscordMessage
+from core.discord_messages import DiscordMessage, DiscordMessageStreamTmp, DiscordMessageRemoveTmp
+from core.message_handling import clean_reply
 from providers.utils import mcp_client_integrations
 from providers.utils.chat import LLMChat
+from providers.utils.chat_store import ChatStore
 from providers.utils.mcp_client_integrations.base import MCPIntegration
+from providers.utils.response_cache import response_cache
+from providers.utils.response_filtering import filter_response
+from providers.utils.system_prompt import SystemPrompt
 
 
 @dataclass
@@ -23,29 +30,128 @@ class LLMResponse:
     text: str
     tool_calls: List[LLMToolCall] = field(default_factory=list)
 
+@dataclass
+class LLMResponseDelta:
+    text: str = ""
+    tool_calls: List[LLMToolCall] = field(default_factory=list)
+
 
 class BaseLLM(ABC):
 
     def __init__(self):
-        self.chats: Dict[str, LLMChat] = {}
+        self.chats = ChatStore(Config.CHAT_STORE_CAPACITY, Config.CHAT_STORE_PATH)
         self.mcp_client_integration_module: Type[MCPIntegration] = self.load_mcp_integration_class()
 
     @abstractmethod
-    async def call(self, history: List[Dict], instructions: str, queue: asyncio.Queue[DiscordMessage | None], channel: str):
+    async def call(self, history: List[Dict], instructions: SystemPrompt, queue: asyncio.Queue[DiscordMessage | None], channel: str):
+        pass
+
+
+    async def preload(self):
+        """Lädt das Modell vorab, falls der Provider das unterstützt"""
+        pass
+
+    def on_activity(self):
+        """Wird bei jeder relevanten Nachricht aufgerufen, noch bevor die Generierung eingereiht wird"""
+        pass
 
-        self.chats.setdefault(channel, LLMChat())
+    async def release_vram(self):
+        """Gibt den VRAM des Modells frei, z.B. vor einer Bildgenerierung"""
+        pass
 
+    @asynccontextmanager
+    async def vram_released(self) -> AsyncIterator[None]:
+        """Gibt den VRAM frei und hält ihn für die Dauer des Blocks frei"""
+        await self.release_vram()
+        yield
 
     @abstractmethod
     async def generate(self, chat: LLMChat, model_name: str | None = None, temperature: float | None = None, timeout: float | None = None, tools: List[Dict] | None = None) -> LLMResponse:
         pass
 
 
+    async def generate_stream(self, chat: LLMChat, model_name: str | None = None, temperature: float | None = None, timeout: float | None = None, tools: List[Dict] | None = None) -> AsyncIterator[LLMResponseDelta]:
+        """Ohne eigene Implementierung wird die vollständige Antwort als einziges Delta geliefert"""
+
+        response = await self.generate(chat, model_name=model_name, temperature=temperature, timeout=timeout, tools=tools)
+        yield LLMResponseDelta(text=response.text, tool_calls=response.tool_calls)
+
+
+    def response_cache_options(self) -> Dict | None:
+        """Modell und Optionen für den Schlüssel des Response Cache, None wenn die Generierung nicht deterministisch ist"""
+        return None
+
+
+    async def respond(self, chat: LLMChat, queue: asyncio.Queue[DiscordMessage | None], tools: List[Dict] | None = None) -> LLMResponse:
+        """Generiert eine Antwort, bei deterministischen Generierungen ohne Tools auch aus dem Response Cache"""
+
+        key = response_cache.key(self.response_cache_options(), chat) if tools is None else None
+
+        if key is not None:
+            cached = response_cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = await self.respond_uncached(chat, queue, tools)
+
+        if key is not None:
+            response_cache.put(key, response)
+
+        return response
+
+
+    async def respond_uncached(self, chat: LLMChat, queue: asyncio.Queue[DiscordMessage | None], tools: List[Dict] | None = None) -> LLMResponse:
+        """Generiert eine Antwort und zeigt sie währenddessen als temporäre Nachricht an, die fortlaufend aktualisiert wird"""
+
+        if not Config.STREAM_RESPONSES:
+            return await self.generate(chat, tools=tools)
+
+        text = ""
+        tool_calls = []
+        last_update = 0.0
+
+        try:
+            async for delta in self.generate_stream(chat, tools=tools):
+
+                text += delta.text
+                tool_calls.extend(delta.tool_calls)
+
+                now = time.monotonic()
+                if delta.text and now - last_update >= Config.STREAM_UPDATE_INTERVAL:
+                    last_update = now
+                    preview = clean_reply(filter_response(text, Config.OLLAMA_MODEL))
+                    if preview:
+                        # Discord erlaubt maximal 2000 Zeichen pro Nachricht
+                        await queue.put(DiscordMessageStreamTmp(value=preview if len(preview) <= 2000 else f"…{preview[-1999:]}"))
+        finally:
+            await queue.put(DiscordMessageRemoveTmp(key="stream"))
+
+        return LLMResponse(text=text, tool_calls=tool_calls)
+
+    known_mcp_integrations = {
+        "MCPIntegration": "providers.utils.mcp_client_integrations.base",
+        "MultimediaMCPIntegration": "providers.utils.mcp_client_integrations.custom",
+    }
+
     @staticmethod
     def load_mcp_integration_class():
 
         class_name = Config.MCP_INTEGRATION_CLASS
 
+        # Bekannte Klassen und vollständige Pfade direkt importieren, statt alle Module zu durchsuchen
+        module_name = BaseLLM.known_mcp_integrations.get(class_name)
+        if module_name is None and "." in class_name:
+            module_name, class_name = class_name.rsplit(".", 1)
+
+        if module_name is not None:
+            try:
+                module = importlib.import_module(module_name)
+                return getattr(module, class_name)
+            except (ImportError, AttributeError) as e:
+                logging.error(f"MCP Integration {Config.MCP_INTEGRATION_CLASS} konnte nicht geladen werden: {e}")
+                from providers.utils.mcp_client_integrations.base import MCPIntegration
+                return MCPIntegration
+
         for _, module_name, _ in pkgutil.iter_modules(mcp_client_integrations.__path__):
             logging.debug(module_name)
             module = importlib.import_module(f"providers.utils.mcp_client_integrations.{module_name}")
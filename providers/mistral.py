@@ -1,31 +1,39 @@
 import asyncio
+import functools
 import json
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator
 from mistralai import Mistral
 
 from core.config import Config
 from core.discord_messages import DiscordMessage, DiscordMessageReply
-from providers.base import BaseLLM, LLMResponse, LLMToolCall
+from providers.base import BaseLLM, LLMResponse, LLMToolCall, LLMResponseDelta
 from providers.utils.chat import LLMChat
 from providers.utils.mcp_client import generate_with_mcp
+from providers.utils.system_prompt import SystemPrompt
+from providers.utils.tokenizer import token_calibration
+
+@functools.cache
+def get_client() -> Mistral:
+    """Der Mistral Client wird erst beim ersten Gebrauch erstellt statt beim Import"""
+    return Mistral(api_key=Config.MISTRAL_API_KEY)
 
-client = Mistral(api_key=Config.MISTRAL_API_KEY)
 
 class MistralLLM(BaseLLM):
 
-    async def call(self, history: List[Dict], instructions: str, queue: asyncio.Queue[DiscordMessage | None],
+    async def call(self, history: List[Dict], instructions: SystemPrompt, queue: asyncio.Queue[DiscordMessage | None],
                    channel: str, use_help_bot=False):
 
         await super().call(history, instructions, queue, channel)
 
-        instructions_entry = {"role": "system", "content": instructions}
-        self.chats[channel].update_history(history, instructions_entry)
+        async with self.chats.use(channel) as chat:
+
+            chat.update_history(history, instructions)
 
-        if Config.MCP_INTEGRATION_CLASS:
-            await generate_with_mcp(self, self.chats[channel], queue, self.mcp_client_integration_module(queue))
-        else:
-            response = await self.generate(self.chats[channel])
-            await queue.put(DiscordMessageReply(value=response.text))
+            if Config.MCP_INTEGRATION_CLASS:
+                await generate_with_mcp(self, chat, queue, self.mcp_client_integration_module(queue))
+            else:
+                response = await self.respond(chat, queue)
+                await queue.put(DiscordMessageReply(value=response.text))
 
 
     async def generate(self, chat: LLMChat, model_name: str | None = None, temperature: float | None = None,
@@ -41,13 +49,19 @@ class MistralLLM(BaseLLM):
         #         instructions=chat.system_entry
         #     )
 
-        response = await client.chat.complete_async(
+        chat.model = model_name
+        estimated_tokens = chat.history.total_tokens
+
+        response = await get_client().chat.complete_async(
             model=model_name,
             messages=chat.history,
             temperature=temperature,
             tools=tools,
         )
 
+        if response.usage:
+            token_calibration.observe(model_name, estimated_tokens, response.usage.prompt_tokens)
+
         message = response.choices[0].message
 
         tool_calls = []
@@ -57,6 +71,47 @@ class MistralLLM(BaseLLM):
         return LLMResponse(message.content, tool_calls)
 
 
+    async def generate_stream(self, chat: LLMChat, model_name: str | None = None, temperature: float | None = None,
+                              timeout: float | None = None, tools: List[Dict] | None = None) -> AsyncIterator[LLMResponseDelta]:
+
+        model_name = model_name if model_name else Config.MISTRAL_MODEL
+
+        chat.model = model_name
+        estimated_tokens = chat.history.total_tokens
+
+        stream = await get_client().chat.stream_async(
+            model=model_name,
+            messages=chat.history,
+            temperature=temperature,
+            tools=tools,
+        )
+
+        # Tool Calls können über mehrere Chunks verteilt sein und werden erst am Ende zusammengesetzt
+        tool_call_parts: Dict[int, Dict[str, str]] = {}
+
+        async for event in stream:
+
+            if event.data.usage:
+                token_calibration.observe(model_name, estimated_tokens, event.data.usage.prompt_tokens)
+
+            delta = event.data.choices[0].delta
+
+            if delta.tool_calls:
+                for t in delta.tool_calls:
+                    part = tool_call_parts.setdefault(t.index or 0, {"name": "", "arguments": ""})
+                    part["name"] += t.function.name or ""
+                    part["arguments"] += t.function.arguments if isinstance(t.function.arguments, str) else json.dumps(t.function.arguments)
+
+            if isinstance(delta.content, str) and delta.content:
+                yield LLMResponseDelta(text=delta.content)
+
+        if tool_call_parts:
+            yield LLMResponseDelta(tool_calls=[
+                LLMToolCall(name=part["name"], arguments=json.loads(part["arguments"]) if part["arguments"] else {})
+                for _, part in sorted(tool_call_parts.items())
+            ])
+
+
 # async def call_ai(history: List[Dict], instructions: str) -> str:
 #     mcp_client = MCPClientSSE(sse_params=SSEServerParams(url=mcp_server_url, timeout=100))
 #
@@ -1,85 +1,214 @@
 import asyncio
 import logging
-from typing import List, Dict, Literal
+from contextlib import asynccontextmanager, nullcontext
+from typing import List, Dict, Literal, AsyncIterator
 
-import tiktoken
+from ollama import AsyncClient
 
 from core.config import Config
+from core.media_store import media_store
 from core.discord_messages import DiscordMessage, DiscordMessageReply, DiscordMessageReplyTmpError
-from providers.base import BaseLLM, LLMResponse, LLMToolCall
+from providers.base import BaseLLM, LLMResponse, LLMToolCall, LLMResponseDelta
 from providers.utils.chat import LLMChat
 from providers.utils.mcp_client import generate_with_mcp
-from providers.utils.vram import wait_for_vram
+from providers.utils.ollama_client import ollama_client_pool
+from providers.utils.ollama_router import ollama_router, OllamaHost
+from providers.utils.residency import residency_manager
+from providers.utils.system_prompt import SystemPrompt
+from providers.utils.tokenizer import token_calibration
+from providers.utils.vram import vram_manager
+
+
+COLD_LOAD_DURATION = 0.5e9  # Nanosekunden, ab denen das Modell für die Anfrage neu geladen wurde
 
 
 class OllamaLLM(BaseLLM):
 
-    async def call(self, history: List[Dict[str, str]], instructions: str, queue: asyncio.Queue[DiscordMessage | None],
+    async def call(self, history: List[Dict[str, str]], instructions: SystemPrompt, queue: asyncio.Queue[DiscordMessage | None],
                    channel: str, use_help_bot=False):
 
         try:
             await super().call(history, instructions, queue, channel)
 
-            instructions_entry = {"role": "system", "content": instructions}
-            self.chats[channel].update_history(history, instructions_entry)
+            async with self.chats.use(channel) as chat:
 
-            logging.debug(self.chats[channel].history)
+                chat.update_history(history, instructions)
 
-            enc = tiktoken.get_encoding("cl100k_base")  # GPT-ähnlicher Tokenizer
-            logging.info(f"System Message Tokens: {len(enc.encode(self.chats[channel].system_entry["content"]))}")
+                logging.debug(chat.history)
 
-            if Config.MCP_SERVER_URL:
-                await generate_with_mcp(self, self.chats[channel], queue, self.mcp_client_integration_module(queue), use_help_bot)
-            else:
-                response = await self.generate(self.chats[channel])
-                await queue.put(DiscordMessageReply(value=response.text))
+                logging.info(f"System Message Tokens: {token_calibration.calibrated(chat.model, chat.history.token_counts[0])}")
+
+                if Config.MCP_SERVER_URL:
+                    await generate_with_mcp(self, chat, queue, self.mcp_client_integration_module(queue), use_help_bot)
+                else:
+                    response = await self.respond(chat, queue)
+                    await queue.put(DiscordMessageReply(value=response.text))
 
         except Exception as e:
             logging.error(e, exc_info=True)
             await queue.put(DiscordMessageReplyTmpError(value=str(e)))
 
 
-    @staticmethod
-    async def generate(chat: LLMChat, model_name: str | None = None, temperature: str | None = None, think: bool | Literal["low", "medium", "high"] | None = None, keep_alive: str | float | None = None, timeout: float | None = None, tools: List[Dict] | None = None) -> LLMResponse:
+    def response_cache_options(self) -> Dict | None:
+        if Config.OLLAMA_MODEL_TEMPERATURE != 0:
+            return None
+        return {"model": Config.OLLAMA_MODEL, "temperature": Config.OLLAMA_MODEL_TEMPERATURE, "think": Config.OLLAMA_THINK}
+
+    async def preload(self):
+        await residency_manager.load()
+
+    def on_activity(self):
+        residency_manager.touch()
 
-        await wait_for_vram(required_gb=11)
+    async def release_vram(self):
+        # Nur lokale Hosts teilen sich den VRAM mit der Bildgenerierung
+        await residency_manager.unload(local_only=True)
+
+    @asynccontextmanager
+    async def vram_released(self) -> AsyncIterator[None]:
+        # Solange z.B. die Bildgenerierung läuft, darf das Modell nicht im Hintergrund wieder geladen werden
+        with residency_manager.paused():
+            await self.release_vram()
+            yield
+
+
+    @staticmethod
+    def chat_arguments(chat: LLMChat, model_name: str | None = None, temperature: str | None = None, think: bool | Literal["low", "medium", "high"] | None = None, keep_alive: str | float | None = None, tools: List[Dict] | None = None) -> Dict:
 
         model_name = model_name if model_name else Config.OLLAMA_MODEL
         temperature = temperature if temperature else Config.OLLAMA_MODEL_TEMPERATURE
         think = think if think else Config.OLLAMA_THINK
-        keep_alive = keep_alive if keep_alive else Config.OLLAMA_KEEP_ALIVE
+        keep_alive = keep_alive if keep_alive is not None else residency_manager.keep_alive()
+
+        return dict(
+            model=model_name,
+            messages=chat.history,
+            keep_alive=keep_alive,
+            options={
+                **({"temperature": temperature} if temperature is not None else {})
+            },
+            **({"think": think} if think is not None else {}),
+            **({"tools": tools} if tools is not None else {}),
+        )
+
+
+    @staticmethod
+    def observe_prompt_tokens(model_name: str, estimated_tokens: int, response, cold: bool):
+        """prompt_eval_count zählt bei einem Treffer im KV Cache nur die neu ausgewerteten Tokens.
+        Kalibriert wird daher nur, wenn der Cache sicher leer war: direkt nach dem Laden des Modells."""
+
+        if cold or (response.load_duration or 0) >= COLD_LOAD_DURATION:
+            token_calibration.observe(model_name, estimated_tokens, response.prompt_eval_count)
+
+
+    @staticmethod
+    @asynccontextmanager
+    async def host_client(host: OllamaHost, model_name: str) -> AsyncIterator[AsyncClient]:
+        """Der VRAM kann nur für lokale Hosts geprüft werden.
+        Ist das Modell auf diesem Host bereits geladen, belegt es seinen VRAM schon und es muss kein weiterer frei sein."""
+
+        loaded = residency_manager.is_loaded(model_name, host.url)
+        vram = vram_manager.reserve(model_name, Config.OLLAMA_REQUIRED_VRAM, Config.VRAM_TIMEOUT) if host.local and not loaded else nullcontext()
+
+        async with vram, ollama_router.lease(host, model_name):
+            yield ollama_client_pool.get(host.url)
+
+        residency_manager.mark_loaded(host.url, model_name)
+
+
+    @staticmethod
+    async def generate(chat: LLMChat, model_name: str | None = None, temperature: str | None = None, think: bool | Literal["low", "medium", "high"] | None = None, keep_alive: str | float | None = None, timeout: float | None = None, tools: List[Dict] | None = None) -> LLMResponse:
+
         timeout = timeout if timeout else Config.OLLAMA_TIMEOUT
+        model_name = model_name if model_name else Config.OLLAMA_MODEL
+
+        async with chat.lock:
+
+            chat.model = model_name
+            estimated_tokens = chat.history.total_tokens
+            media_store.refresh(path for entry in chat.history for path in entry.get("images", ()))
+            error = None
+
+            for host in await ollama_router.candidates(model_name, chat.ollama_host):
 
-        async with (chat.lock):
-
-            try:
-
-                response = await asyncio.wait_for(
-                    chat.client.chat(
-                        model=model_name,
-                        messages=chat.history,
-                        stream=False,
-                        keep_alive=keep_alive,
-                        options={
-                            **({"temperature": temperature} if temperature is not None else {})
-                        },
-                        **({"think": think} if think is not None else {}),
-                        **({"tools": tools} if tools is not None else {}),
-                    ),
-                    timeout=timeout,
-                )
+                cold = host.take_cold(model_name)
+
+                try:
+                    async with OllamaLLM.host_client(host, model_name) as client:
+                        response = await asyncio.wait_for(
+                            client.chat(
+                                stream=False,
+                                **OllamaLLM.chat_arguments(chat, model_name, temperature, think, keep_alive, tools),
+                            ),
+                            timeout=timeout,
+                        )
+
+                except Exception as e:
+                    logging.error(f"Ollama Fehler auf {host.url}: {e}", exc_info=True)
+                    error = e
+                    continue
 
                 logging.info(response)
 
+                if Config.OLLAMA_STICKY_ROUTING:
+                    chat.ollama_host = host.url
+
+                OllamaLLM.observe_prompt_tokens(model_name, estimated_tokens, response, cold)
+
                 tool_calls = [LLMToolCall(name=t.function.name, arguments=dict(t.function.arguments)) for t in response.message.tool_calls] if response.message.tool_calls else []
 
                 return LLMResponse(text=response.message.content, tool_calls=tool_calls)
 
+            raise Exception(f"Ollama Fehler: {error}")
+
+
+    async def generate_stream(self, chat: LLMChat, model_name: str | None = None, temperature: str | None = None, think: bool | Literal["low", "medium", "high"] | None = None, keep_alive: str | float | None = None, timeout: float | None = None, tools: List[Dict] | None = None) -> AsyncIterator[LLMResponseDelta]:
+
+        timeout = timeout if timeout else Config.OLLAMA_TIMEOUT
+        model_name = model_name if model_name else Config.OLLAMA_MODEL
+
+        async with chat.lock:
+
+            chat.model = model_name
+            estimated_tokens = chat.history.total_tokens
+            media_store.refresh(path for entry in chat.history for path in entry.get("images", ()))
+            error = None
+
+            for host in await ollama_router.candidates(model_name, chat.ollama_host):
+
+                started = False
+                cold = host.take_cold(model_name)
+
+                try:
+                    async with self.host_client(host, model_name) as client, asyncio.timeout(timeout):
+
+                        stream = await client.chat(
+                            stream=True,
+                            **self.chat_arguments(chat, model_name, temperature, think, keep_alive, tools),
+                        )
+
+                        async for chunk in stream:
+
+                            if chunk.done:
+                                logging.info(chunk)
+                                self.observe_prompt_tokens(model_name, estimated_tokens, chunk, cold)
+
+                            tool_calls = [LLMToolCall(name=t.function.name, arguments=dict(t.function.arguments)) for t in chunk.message.tool_calls] if chunk.message.tool_calls else []
 
-            except Exception as e:
-                logging.error(e, exc_info=True)
-                raise Exception(f"Ollama Fehler: {e}")
+                            started = True
+                            yield LLMResponseDelta(text=chunk.message.content or "", tool_calls=tool_calls)
 
+                except Exception as e:
+                    logging.error(f"Ollama Fehler auf {host.url}: {e}", exc_info=True)
+                    # Nach der ersten Ausgabe kann nicht mehr auf einen anderen Host gewechselt werden
+                    if started:
+                        raise Exception(f"Ollama Fehler: {e}")
+                    error = e
+                    continue
 
+                if Config.OLLAMA_STICKY_ROUTING:
+                    chat.ollama_host = host.url
 
+                return
 
+            raise Exception(f"Ollama Fehler: {error}")
@@ -1,31 +1,178 @@
 import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Dict
+from typing import List, Dict, Callable, Iterable, SupportsIndex, Sequence
+
+import functools
 
 import tiktoken
-from GPUtil import GPUtil
-from ollama import AsyncClient
 
 from core.config import Config
+from providers.utils.system_prompt import SystemPrompt, prefix_reuse_stats
+from providers.utils.tokenizer import get_tokenizer, token_calibration
+from providers.utils.vram import vram_manager
+
+
+def fingerprint(entry: Dict) -> bytes:
+    """Stabiler Hash eines Eintrags, gleichwertig zum Vergleich der Dicts"""
+    return hashlib.blake2b(json.dumps(entry, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"), digest_size=16).digest()
+
+
+def longest_overlap(suffix_source: Sequence[bytes], prefix_source: Sequence[bytes]) -> int:
+    """Länge des längsten Suffix von suffix_source, das ein Präfix von prefix_source ist (KMP Präfixfunktion, linear)"""
+
+    pattern = list(prefix_source)
+    failure = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = failure[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        failure[i] = k
+
+    k = 0
+    for item in suffix_source:
+        while k and (k == len(pattern) or item != pattern[k]):
+            k = failure[k - 1]
+        if k < len(pattern) and item == pattern[k]:
+            k += 1
+    return k
+
+
+class ChatHistory(list):
+    """Nachrichtenverlauf, der Tokenanzahl und Fingerprint jedes Eintrags beim Einfügen zwischenspeichert"""
+
+    def __init__(self, entries: Iterable[Dict] = (), token_counter: Callable[[Dict], int] = None):
+        super().__init__()
+        self.token_counter = token_counter
+        self.token_counts: List[int] = []
+        self.fingerprints: List[bytes] = []
+        self.total_tokens = 0
+        self.extend(entries)
+
+    def _count(self, entries: Iterable[Dict]) -> List[int]:
+        return [self.token_counter(entry) for entry in entries]
+
+    def append(self, entry: Dict):
+        count = self.token_counter(entry)
+        super().append(entry)
+        self.token_counts.append(count)
+        self.fingerprints.append(fingerprint(entry))
+        self.total_tokens += count
+
+    def extend(self, entries: Iterable[Dict], fingerprints: Iterable[bytes] | None = None):
+        entries = list(entries)
+        counts = self._count(entries)
+        super().extend(entries)
+        self.token_counts.extend(counts)
+        self.fingerprints.extend(fingerprints if fingerprints is not None else (fingerprint(entry) for entry in entries))
+        self.total_tokens += sum(counts)
+
+    def __iadd__(self, entries: Iterable[Dict]):
+        self.extend(entries)
+        return self
+
+    def insert(self, index: SupportsIndex, entry: Dict):
+        count = self.token_counter(entry)
+        super().insert(index, entry)
+        self.token_counts.insert(index, count)
+        self.fingerprints.insert(index, fingerprint(entry))
+        self.total_tokens += count
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            counts = self._count(value)
+            self.total_tokens -= sum(self.token_counts[index])
+            self.token_counts[index] = counts
+            self.fingerprints[index] = [fingerprint(entry) for entry in value]
+            self.total_tokens += sum(counts)
+        else:
+            count = self.token_counter(value)
+            self.total_tokens += count - self.token_counts[index]
+            self.token_counts[index] = count
+            self.fingerprints[index] = fingerprint(value)
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self.total_tokens -= sum(self.token_counts[index]) if isinstance(index, slice) else self.token_counts[index]
+        del self.token_counts[index]
+        del self.fingerprints[index]
+        super().__delitem__(index)
+
+    def pop(self, index: SupportsIndex = -1) -> Dict:
+        entry = super().pop(index)
+        self.total_tokens -= self.token_counts.pop(index)
+        self.fingerprints.pop(index)
+        return entry
+
+    def remove(self, entry: Dict):
+        del self[self.index(entry)]
+
+    def clear(self):
+        super().clear()
+        self.token_counts.clear()
+        self.fingerprints.clear()
+        self.total_tokens = 0
+
+    def reverse(self):
+        super().reverse()
+        self.token_counts.reverse()
+        self.fingerprints.reverse()
+
+    def sort(self, *args, **kwargs):
+        raise TypeError("ChatHistory kann nicht sortiert werden")
+
+
+@functools.cache
+def default_max_tokens() -> int:
+    """Ohne GPU wird nur ein kleiner Kontext verwendet. Wird erst beim ersten Gebrauch ermittelt, statt beim Import."""
+
+    if vram_manager.backend is not None:
+        gpu_count = vram_manager.gpu_count()
+    else:
+        from GPUtil import GPUtil
+        gpu_count = len(GPUtil.getGPUs())
+
+    max_tokens = 3700 if gpu_count == 0 else Config.MAX_TOKENS
+    logging.debug(f"MAX TOKENS: {max_tokens}")
+    return max_tokens
 
 
 class LLMChat:
 
-    client: AsyncClient
     lock: asyncio.Lock
-    history: List[Dict[str, str]]
+    ollama_host: str | None
+    system_prompt: SystemPrompt
+    history: ChatHistory
     tokenizer: tiktoken
-
-    max_tokens = 3700 if len(GPUtil.getGPUs()) == 0 else Config.MAX_TOKENS
-    logging.debug(f"MAX TOKENS: {max_tokens}")
+    model: str | None
 
     def __init__(self):
 
-        self.client = AsyncClient(host=Config.OLLAMA_URL)
         self.lock = asyncio.Lock()
+        self.tokenizer = get_tokenizer()
+        self.model = None  # Zuletzt verwendetes Modell, bestimmt den Korrekturfaktor der Tokenanzahl
+        self.ollama_host = None  # Bevorzugter Ollama Host bei Sticky Routing, damit der Prompt Cache warm bleibt
+        self.system_prompt = SystemPrompt()
         self.history = []
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
+    @property
+    def max_tokens(self) -> int:
+        return default_max_tokens()
+
+    @property
+    def history(self) -> ChatHistory:
+        return self._history
+
+    @history.setter
+    def history(self, value: Iterable[Dict]):
+        if isinstance(value, ChatHistory) and value.token_counter == self.count_entry_tokens:
+            self._history = value
+        else:
+            self._history = ChatHistory(value, token_counter=self.count_entry_tokens)
 
     @property
     def system_entry(self) -> Dict[str, str] | None:
@@ -36,50 +183,94 @@ class LLMChat:
     @system_entry.setter
     def system_entry(self, value: Dict[str, str]):
         if not self.history:
-            self.history = [value]
+            self.history.append(value)
         else:
             self.history[0] = value
 
-    def update_history(self, new_history: List[Dict[str, str]], instructions_entry: Dict[str, str]|None = None, min_overlap=1):
+    def set_system_prompt(self, system_prompt: SystemPrompt):
+        """Ersetzt nur den System Eintrag. Der restliche Verlauf bleibt unverändert, damit der Prompt Cache wiederverwendet werden kann."""
+
+        previous = self.system_entry["content"] if self.system_entry and self.system_entry["role"] == "system" else None
+        self.system_prompt = system_prompt
+        entry = system_prompt.entry()
 
-        history_without_tool_results = [x for x in self.history if not (x["role"] == "system" and x["content"].startswith('#'))]
+        if previous == entry["content"]:
+            prefix_reuse_stats.record(previous, entry["content"])
+            return
+
+        reuse = prefix_reuse_stats.record(previous, entry["content"])
+        logging.info(f"System Prompt geändert {system_prompt.versions()}, Präfix wiederverwendet: {reuse:.0%} ({prefix_reuse_stats.stats()})")
+
+        if previous is None:
+            self.history.insert(0, entry)
+        else:
+            self.history[0] = entry
 
-        #print("HISTORY WITHOUT TOOLS")
-        #print(history_without_tool_results)
-        #print(new_history)
+    def update_history(self, new_history: List[Dict[str, str]], system_prompt: SystemPrompt | None = None, min_overlap=1):
 
-        max_overlap_length = len(history_without_tool_results)
-        overlap_length = None
+        cached_fingerprints = [f for x, f in zip(self.history, self.history.fingerprints) if not (x["role"] == "system" and x.get("content", "").startswith('#'))]
+        new_fingerprints = [fingerprint(x) for x in new_history]
 
-        for length in range(max_overlap_length, min_overlap, -1):
-            if history_without_tool_results[-length:] == new_history[:length]:
-                overlap_length = length
-                logging.info(f"OVERLAP LENGTH: {overlap_length}")
-                break
+        # Nach einem Trim beginnt der Chat später als der geladene Verlauf: ältere Nachrichten wurden bereits entfernt
+        first_kept = next((f for x, f in zip(self.history, self.history.fingerprints) if x["role"] != "system"), None)
+        if first_kept is not None and first_kept in new_fingerprints[1:]:
+            skipped = new_fingerprints.index(first_kept)
+            logging.info(f"{skipped} bereits gekürzte Nachrichten werden übersprungen")
+            new_history = new_history[skipped:]
+            new_fingerprints = new_fingerprints[skipped:]
+
+        overlap_length = longest_overlap(cached_fingerprints, new_fingerprints)
+
+        if overlap_length <= min_overlap:
+            overlap_length = None
+        else:
+            logging.info(f"OVERLAP LENGTH: {overlap_length}")
 
         if not overlap_length:
             logging.info("KEIN OVERLAP")
             logging.info(self.history)
             logging.info(new_history)
-            self.history = [instructions_entry] if instructions_entry else []
-            self.history.extend(new_history)
-        elif instructions_entry:
-            if self.history[0] == instructions_entry:
-                self.history = self.history + new_history[overlap_length:]
-            else:
-                logging.info("NEW INSTRUCTIONS")
-                logging.info(self.history[0])
-                logging.info(instructions_entry)
-                self.history = [instructions_entry]
-                self.history.extend(new_history)
+            self.history = [self.system_entry] if self.system_entry and self.system_entry["role"] == "system" else []
+            self.history.extend(new_history, new_fingerprints)
         else:
-            self.history = self.history + new_history[overlap_length:]
+            self.history.extend(new_history[overlap_length:], new_fingerprints[overlap_length:])
+
+        if system_prompt is not None:
+            # Das Tool Segment wird erst von generate_with_mcp gesetzt und bis dahin beibehalten
+            if system_prompt.get("tools") is None and self.system_prompt.get("tools") is not None:
+                system_prompt = system_prompt.with_segments(tools=self.system_prompt.get("tools"))
+            self.set_system_prompt(system_prompt)
 
-        logging.info(self.count_tokens())
+        token_count = self.count_tokens()
+        logging.info(token_count)
 
-        if self.count_tokens() > self.max_tokens:
+        if token_count > self.max_tokens:
             logging.info("CUTTING BECAUSE OF EXCEEDING TOKEN COUNT")
-            self.history = new_history
+            if Config.HISTORY_TRIM_MODE == "window":
+                self.trim_history(self.max_tokens)
+            else:
+                self.history = [self.system_entry, *new_history] if self.system_entry and self.system_entry["role"] == "system" else new_history
+
+    def trim_history(self, max_tokens: int):
+        """Entfernt die ältesten Nachrichten samt zugehöriger Tool Results, bis der Chat in das Token Budget passt.
+        Der System Eintrag bleibt erhalten und der verbleibende Verlauf unverändert, damit der Prompt Cache des Backends wiederverwendet werden kann."""
+
+        start = 1 if self.system_entry and self.system_entry["role"] == "system" else 0
+        total = self.history.total_tokens
+        max_tokens = max_tokens / token_calibration.factor(self.model)  # Budget in geschätzte Tokens umrechnen
+        end = start
+
+        # Immer ganze Turns entfernen: die User Nachricht und alle folgenden Nicht-User Einträge
+        while total > max_tokens and end < len(self.history) - 1:
+            total -= self.history.token_counts[end]
+            end += 1
+            while end < len(self.history) - 1 and self.history[end]["role"] != "user":
+                total -= self.history.token_counts[end]
+                end += 1
+
+        if end > start:
+            logging.info(f"TRIMMING {end - start} ENTRIES")
+            del self.history[start:end]
 
 
     def build_prompt(self, history=None) -> str:
@@ -93,6 +284,13 @@ class LLMChat:
             prompt_lines.append(f"{role}: {content}")
         return "\n".join(prompt_lines)
 
+    def count_entry_tokens(self, entry: Dict) -> int:
+        """Tokenanzahl eines einzelnen Eintrags inklusive Zeilenumbruch aus build_prompt"""
+        return len(self.tokenizer.encode(self.build_prompt([entry]))) + 1
+
     def count_tokens(self, history=None) -> int:
+        """Geschätzte Tokenanzahl, korrigiert mit dem für das Modell gelernten Faktor"""
+        if history is None:
+            return token_calibration.calibrated(self.model, self.history.total_tokens)
         prompt = self.build_prompt(history)
-        return len(self.tokenizer.encode(prompt))
\ No newline at end of file
+        return token_calibration.calibrated(self.model, len(self.tokenizer.encode(prompt)))
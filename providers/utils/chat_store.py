@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, AsyncIterator, List, Callable, Any
+
+from providers.utils.chat import LLMChat
+
+
+class ChatStore:
+    """LRU Speicher für die Chats der Channels.
+    Chats, die aus dem Speicher verdrängt werden, werden komprimiert in eine SQLite Datei ausgelagert und bei Bedarf wiederhergestellt.
+    Komprimierung und Datenbankzugriffe laufen in einem eigenen Thread, damit sie den Event Loop nicht blockieren.
+    Da es nur einen Thread gibt, wird eine Auslagerung immer vor einer späteren Wiederherstellung desselben Chats geschrieben."""
+
+    def __init__(self, capacity: int, path: str | None = None):
+        self.capacity = capacity
+        self.path = path
+        self._chats: OrderedDict[str, LLMChat] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._in_use: Dict[str, int] = {}  # Channel -> Anzahl laufender Anfragen
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-store")
+
+        self.hits = 0
+        self.misses = 0
+        self.restores = 0
+        self.spills = 0
+
+    @property
+    def db(self) -> sqlite3.Connection | None:
+        if self._db is None and self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS chats (channel TEXT PRIMARY KEY, history BLOB NOT NULL, updated REAL NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    async def get(self, channel: str) -> LLMChat:
+
+        chat = self._chats.get(channel)
+
+        if chat is not None:
+            self.hits += 1
+            self._chats.move_to_end(channel)
+            return chat
+
+        self.misses += 1
+        restored = await self._run(self._restore, channel)
+
+        # Während der Wiederherstellung kann eine andere Anfrage den Chat bereits angelegt haben
+        chat = self._chats.get(channel)
+        if chat is not None:
+            self._chats.move_to_end(channel)
+            return chat
+
+        chat = restored if restored is not None else LLMChat()
+
+        self._chats[channel] = chat
+        self._evict()
+
+        logging.debug(f"Chat Store: {self.stats()}")
+
+        return chat
+
+    @asynccontextmanager
+    async def use(self, channel: str) -> AsyncIterator[LLMChat]:
+        """Liefert den Chat und schützt ihn während der gesamten Anfrage (inklusive Tool Calls) vor dem Auslagern"""
+
+        self._in_use[channel] = self._in_use.get(channel, 0) + 1
+        try:
+            yield await self.get(channel)
+        finally:
+            self._in_use[channel] -= 1
+            if not self._in_use[channel]:
+                del self._in_use[channel]
+            self._evict()  # Während der Anfrage aufgeschobene Auslagerungen nachholen
+
+    def __contains__(self, channel: str) -> bool:
+        return channel in self._chats
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def _evict(self):
+
+        for channel in list(self._chats.keys()):
+            if len(self._chats) <= self.capacity:
+                break
+
+            chat = self._chats[channel]
+            if channel in self._in_use or chat.lock.locked():  # Laufende Anfragen nicht auslagern
+                continue
+
+            del self._chats[channel]
+            if self.path and chat.history:
+                self._run(self._spill, channel, list(chat.history)).add_done_callback(self._log_spill_error)
+
+    def _run(self, func: Callable[..., Any], *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _log_spill_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"Chat konnte nicht ausgelagert werden: {future.exception()}")
+
+    def _spill(self, channel: str, history: List[Dict]):
+
+        if not self.db or not history:
+            return
+
+        data = zlib.compress(json.dumps(history, ensure_ascii=False, default=str).encode("utf-8"))
+        self.db.execute("INSERT OR REPLACE INTO chats (channel, history, updated) VALUES (?, ?, ?)", (channel, data, time.time()))
+        self.db.commit()
+
+        self.spills += 1
+        logging.info(f"Chat ausgelagert: {channel} ({len(data)} Bytes)")
+
+    def _restore(self, channel: str) -> LLMChat | None:
+
+        if not self.db:
+            return None
+
+        row = self.db.execute("SELECT history FROM chats WHERE channel = ?", (channel,)).fetchone()
+        if not row:
+            return None
+
+        try:
+            history = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        except (zlib.error, ValueError) as e:
+            logging.error(f"Ausgelagerter Chat {channel} ist beschädigt: {e}")
+            return None
+
+        chat = LLMChat()
+        chat.history = history
+
+        self.restores += 1
+        logging.info(f"Chat wiederhergestellt: {channel} ({len(history)} Nachrichten)")
+
+        return chat
+
+    def flush(self):
+        """Lagert alle Chats aus, damit sie nach einem Neustart wiederhergestellt werden können"""
+
+        for channel, chat in self._chats.items():
+            self._spill(channel, list(chat.history))
+
+    def close(self):
+        self._executor.shutdown(wait=True)  # Ausstehende Auslagerungen abschließen
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int | float]:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._chats),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "restores": self.restores,
+            "spills": self.spills,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
@@ -2,9 +2,10 @@ import asyncio
 import json
 import logging
 import re
+from contextlib import nullcontext
 from typing import List, Dict
 
-from fastmcp import Client
+from mcp.types import CallToolResult
 
 from core.config import Config
 from core.discord_messages import DiscordMessage, DiscordMessageReplyTmp, \
@@ -13,164 +14,199 @@ from providers.base import BaseLLM, LLMToolCall
 from providers.utils.chat import LLMChat
 from providers.utils.error_reasoning import error_reasoning
 from providers.utils.mcp_client_integrations.base import MCPIntegration
+from providers.utils.mcp_session_pool import mcp_session_pool
 from providers.utils.response_filtering import filter_response
-from providers.utils.tool_calls import mcp_to_dict_tools, get_custom_tools_system_prompt, get_tools_system_prompt
+from providers.utils.tool_catalog import tool_catalog_cache, ToolCatalog
+from providers.utils.tool_result_cache import tool_result_cache
 
 
 async def generate_with_mcp(llm: BaseLLM, chat: LLMChat, queue: asyncio.Queue[DiscordMessage | None], integration: MCPIntegration, use_help_bot: bool = False):
 
     if not Config.MCP_SERVER_URL:
         raise Exception("Kein MCP Server URL verfügbar")
-    client = Client(Config.MCP_SERVER_URL, log_handler=integration.log_handler, progress_handler=integration.progress_handler)
 
-    async with client:
+    catalog = await tool_catalog_cache.get(integration)
 
-        mcp_tools = await client.list_tools()
+    logging.debug(catalog.dict_tools)
 
-        mcp_tools = integration.filter_tool_list(mcp_tools)
-        mcp_dict_tools = mcp_to_dict_tools(mcp_tools)
+    # Bei unverändertem Katalog bleibt der System Eintrag identisch
+    chat.set_system_prompt(chat.system_prompt.with_segments(tools=catalog.system_prompt))
 
-        logging.info(mcp_tools)
-        logging.info(mcp_dict_tools)
+    tool_call_errors = False
 
-        if not Config.TOOL_INTEGRATION:
-            chat.system_entry["content"] += get_custom_tools_system_prompt(mcp_tools)
-        else:
-            chat.system_entry["content"] += get_tools_system_prompt()
 
-        tool_call_errors = False
+    for i in range(Config.MAX_TOOL_CALLS):
+
+        logging.info(f"Tool Call Errors: {tool_call_errors}")
+
+        deny_tools = Config.DENY_RECURSIVE_TOOL_CALLING and not tool_call_errors and i > 0
 
+        use_integrated_tools = Config.TOOL_INTEGRATION and not deny_tools
 
-        for i in range(Config.MAX_TOOL_CALLS):
+        logging.info(f"Use integrated tools: {use_integrated_tools}")
 
-            logging.info(f"Tool Call Errors: {tool_call_errors}")
+        response = await llm.respond(chat, queue, tools=catalog.dict_tools if use_integrated_tools else None)
 
-            deny_tools = Config.DENY_RECURSIVE_TOOL_CALLING and not tool_call_errors and i > 0
+        logging.info(f"RESPONSE: {response}")
 
-            use_integrated_tools = Config.TOOL_INTEGRATION and not deny_tools
 
-            logging.info(f"Use integrated tools: {use_integrated_tools}")
+        if response.text:
 
-            response = await llm.generate(chat, tools= mcp_to_dict_tools(mcp_tools) if use_integrated_tools else None)
+            chat.history.append({"role": "assistant", "content": response.text})
+            await queue.put(DiscordMessageReply(value=filter_response(response.text, Config.OLLAMA_MODEL)))
 
-            logging.info(f"RESPONSE: {response}")
+        if deny_tools:
+            break
 
+        try:
+            if Config.TOOL_INTEGRATION and response.tool_calls:
+                tool_calls = response.tool_calls
+            else:
+                tool_calls = extract_custom_tool_calls(response.text)
 
-            if response.text:
+            tool_call_errors = False
 
-                chat.history.append({"role": "assistant", "content": response.text})
-                await queue.put(DiscordMessageReply(value=filter_response(response.text, Config.OLLAMA_MODEL)))
+        except Exception as e:
 
-            if deny_tools:
+            logging.exception(e, exc_info=True)
+
+            if Config.MCP_ERROR_HELP_DISCORD_ID and use_help_bot:
+                await queue.put(DiscordMessageReplyTmpError(
+                    value=f"<@{Config.MCP_ERROR_HELP_DISCORD_ID}> Ein Fehler ist aufgetreten: {e}",
+                    embed=False
+                ))
                 break
 
             try:
-                if Config.TOOL_INTEGRATION and response.tool_calls:
-                    tool_calls = response.tool_calls
-                else:
-                    tool_calls = extract_custom_tool_calls(response.text)
+                await queue.put(DiscordMessageReplyTmp(
+                    key="reasoning",
+                    value="Aufgetretener Fehler wird analysiert..."
+                ))
+                reasoning = await error_reasoning(str(e), llm, chat)
 
-                tool_call_errors = False
+            except Exception as f:
+                logging.error(f)
+                reasoning = str(e)
 
-            except Exception as e:
+            finally:
+                await queue.put(DiscordMessageRemoveTmp(key="reasoning"))
 
-                logging.exception(e, exc_info=True)
+            chat.history.append({"role": "user", "name": "system", "content": reasoning})
+            tool_call_errors = True
 
-                if Config.MCP_ERROR_HELP_DISCORD_ID and use_help_bot:
-                    await queue.put(DiscordMessageReplyTmpError(
-                        value=f"<@{Config.MCP_ERROR_HELP_DISCORD_ID}> Ein Fehler ist aufgetreten: {e}",
-                        embed=False
-                    ))
-                    break
+            continue
 
-                try:
-                    await queue.put(DiscordMessageReplyTmp(
-                        key="reasoning",
-                        value="Aufgetretener Fehler wird analysiert..."
-                    ))
-                    reasoning = await error_reasoning(str(e), llm, chat)
 
-                except Exception as f:
-                    logging.error(f)
-                    reasoning = str(e)
+        if tool_calls:
+
+            run_again = False
+
+            # VRAM intensive Tools (z.B. Bildgenerierung) brauchen den Speicher des Sprachmodells
+            unload = catalog.unload_tools.intersection(tool_call.name for tool_call in tool_calls)
 
-                finally:
-                    await queue.put(DiscordMessageRemoveTmp(key="reasoning"))
+            async with llm.vram_released() if unload else nullcontext():
+                results = await execute_tool_calls(tool_calls, catalog, integration, queue)
 
-                chat.history.append({"role": "user", "name": "system", "content": reasoning})
-                tool_call_errors = True
+            # Die Ergebnisse werden in der ursprünglichen Reihenfolge verarbeitet, damit der Prompt deterministisch bleibt
+            for tool_call, result in zip(tool_calls, results):
 
-                continue
+                name = tool_call.name
 
+                try:
+
+                    # Ein Abbruch einzelner Tool Calls darf nicht die ganze Generierung beenden
+                    if isinstance(result, asyncio.CancelledError):
+                        raise Exception(f"Tool Call {name} wurde abgebrochen")
+                    if isinstance(result, BaseException):
+                        raise result
+
+                    logging.info(f"Tool Call Result bekommen für {name}")
 
-            if tool_calls:
+                    if not result.content:
+                        logging.warning("Kein Tool Result Content, manuelle Unterbrechung")
+                        continue # Manuelle Unterbrechung
 
-                run_again = False
+                    else:
 
-                for tool_call in tool_calls:
+                        if use_integrated_tools:
+                            chat.history.append(construct_tool_call_message([tool_call]))
 
-                    logging.info(f"TOOL CALL: {tool_call}")
+                        run_again = await integration.process_tool_result(name, result, chat) or run_again
 
-                    name = tool_call.name
-                    arguments = tool_call.arguments
+                except Exception as e:
+                    logging.exception(e, exc_info=True)
 
+                    if Config.MCP_ERROR_HELP_DISCORD_ID and use_help_bot:
+                        await queue.put(DiscordMessageReplyTmpError(
+                            value=f"<@{Config.MCP_ERROR_HELP_DISCORD_ID}> Ein Fehler ist aufgetreten: {e}",
+                            embed=False
+                        ))
+                        # Die übrigen Tool Calls sind bereits ausgeführt, ihre Ergebnisse werden weiterhin verarbeitet
+                        continue
 
                     try:
+                        await queue.put(DiscordMessageReplyTmp(key="reasoning", value="Aufgetretener Fehler wird analysiert..."))
+                        reasoning = await error_reasoning(str(e), llm, chat)
 
-                        formatted_args = "\n".join(f" - **{k}:** {v}" for k, v in arguments.items())
-                        await queue.put(DiscordMessageReplyTmp(key=name, value=f"Das Tool **{name}** wird aufgerufen:\n{formatted_args}"))
+                    except Exception as f:
+                        logging.error(f)
+                        reasoning = str(e)
 
-                        result = await client.call_tool(name, arguments)
+                    finally:
+                        await queue.put(DiscordMessageRemoveTmp(key="reasoning"))
 
+                    chat.history.append(construct_tool_call_results(name, reasoning))
 
+                    tool_call_errors = True
 
-                        logging.info(f"Tool Call Result bekommen für {name}")
 
-                        if not result.content:
-                            logging.warning("Kein Tool Result Content, manuelle Unterbrechung")
-                            continue # Manuelle Unterbrechung
+            logging.info(chat.history)
 
-                        else:
+            if not run_again:
+                logging.debug("Die Tool Results werden nicht erneut vom LLM verarbeitet")
+                break
 
-                            if use_integrated_tools:
-                                chat.history.append(construct_tool_call_message([tool_call]))
+        else:
+            break
 
-                            run_again = await integration.process_tool_result(name, result, chat) or run_again
 
-                    except Exception as e:
-                        logging.exception(e, exc_info=True)
+async def execute_tool_calls(tool_calls: List[LLMToolCall], catalog: ToolCatalog, integration: MCPIntegration, queue: asyncio.Queue[DiscordMessage | None]) -> List[CallToolResult | BaseException]:
+    """Führt die Tool Calls nebenläufig aus. Als seriell markierte Tools laufen allein.
+    Die Ergebnisse (oder Exceptions) werden in der Reihenfolge der Tool Calls zurückgegeben."""
 
-                        if Config.MCP_ERROR_HELP_DISCORD_ID and use_help_bot:
-                            await queue.put(DiscordMessageReplyTmpError(
-                                value=f"<@{Config.MCP_ERROR_HELP_DISCORD_ID}> Ein Fehler ist aufgetreten: {e}",
-                                embed=False
-                            ))
-                            break
+    semaphore = asyncio.Semaphore(Config.MCP_TOOL_CONCURRENCY)
 
-                        try:
-                            await queue.put(DiscordMessageReplyTmp(key="reasoning", value="Aufgetretener Fehler wird analysiert..."))
-                            reasoning = await error_reasoning(str(e), llm, chat)
+    async def execute(tool_call: LLMToolCall) -> CallToolResult:
+        async with semaphore:
 
-                        except Exception as f:
-                            logging.error(f)
-                            reasoning = str(e)
+            logging.info(f"TOOL CALL: {tool_call}")
 
-                        finally:
-                            await queue.put(DiscordMessageRemoveTmp(key="reasoning"))
+            formatted_args = "\n".join(f" - **{k}:** {v}" for k, v in tool_call.arguments.items())
+            await queue.put(DiscordMessageReplyTmp(key=tool_call.name, value=f"Das Tool **{tool_call.name}** wird aufgerufen:\n{formatted_args}"))
 
-                        chat.history.append(construct_tool_call_results(name, reasoning))
+            async def call_tool() -> CallToolResult:
+                async with mcp_session_pool.session(integration) as client:
+                    return await client.call_tool(tool_call.name, tool_call.arguments)
 
-                        tool_call_errors = True
+            return await tool_result_cache.call(tool_call.name, tool_call.arguments, catalog.cache_ttls.get(tool_call.name), call_tool)
 
+    async def execute_batch(batch: List[LLMToolCall]) -> List[CallToolResult | BaseException]:
+        return await asyncio.gather(*(execute(t) for t in batch), return_exceptions=True) if batch else []
 
-                logging.info(chat.history)
+    results = []
+    batch = []
 
-                if not run_again:
-                    logging.debug("Die Tool Results werden nicht erneut vom LLM verarbeitet")
-                    break
+    for tool_call in tool_calls:
+        if tool_call.name in catalog.serial_tools:
+            results.extend(await execute_batch(batch))
+            batch = []
+            results.extend(await execute_batch([tool_call]))
+        else:
+            batch.append(tool_call)
 
-            else:
-                break
+    results.extend(await execute_batch(batch))
+
+    return results
 
 
 def extract_custom_tool_calls(text: str) -> List[LLMToolCall]:
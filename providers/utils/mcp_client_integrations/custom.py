@@ -1,7 +1,6 @@
 import base64
 import logging
 import mimetypes
-import os
 import secrets
 from typing import List
 
@@ -10,6 +9,7 @@ from mcp import Tool
 from mcp.types import CallToolResult
 
 from core.config import Config
+from core.media_store import media_store
 from core.discord_messages import DiscordMessageFileTmp, DiscordMessageReplyTmp, \
     DiscordMessageProgressTmp, DiscordMessageFile
 from providers.utils.chat import LLMChat
@@ -77,19 +77,18 @@ class MultimediaMCPIntegration(MCPIntegration):
 
             filename = f"{secrets.token_urlsafe(8)}{ext}"
 
+            # Damit die Datei schonmal gespeichert ist
+            path = await media_store.put(file_content, ext or "")
+
             if result.content[0].type == "image":
 
                 await self.queue.put(DiscordMessageFile(value=file_content, filename=filename))
-                chat.history.append({"role": "assistant", "content": "", "images": [os.path.join("downloads", filename)]})
+                chat.history.append({"role": "assistant", "content": "", "images": [path]})
 
             else:
                 await self.queue.put(DiscordMessageFile(value=file_content, filename=filename))
                 chat.history.append({"role": "assistant", "content": f"Du hast eine Datei gesendet: {filename}"})
 
-            # Damit die Datei schonmal gespeichert ist
-            with open(os.path.join("downloads", filename), "wb") as f:
-                f.write(file_content)
-
             return False
 
         else:
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import List, AsyncIterator, TYPE_CHECKING, Callable, Dict, Any
+
+import mcp.types
+from mcp.types import CallToolResult
+from fastmcp import Client
+from fastmcp.client.logging import LogMessage
+from fastmcp.client.messages import MessageHandler
+
+from core.config import Config
+
+if TYPE_CHECKING:
+    from providers.utils.mcp_client_integrations.base import MCPIntegration
+
+
+class MCPSessionMessageHandler(MessageHandler):
+
+    def __init__(self, pool: "MCPSessionPool"):
+        self.pool = pool
+
+    async def on_tool_list_changed(self, message: mcp.types.ToolListChangedNotification):
+        logging.info("MCP Tool Liste wurde geändert")
+        for callback in self.pool.tool_list_changed_callbacks:
+            callback()
+
+
+class MCPSession:
+    """Dauerhaft verbundener MCP Client, über den mehrere Anfragen gleichzeitig laufen können.
+    Progress Nachrichten werden pro Tool Call an die Integration der Anfrage geleitet.
+    Log Nachrichten tragen keinen Bezug zur Anfrage und werden nur weitergeleitet, solange eine einzige Anfrage die Session benutzt."""
+
+    def __init__(self, url: str, message_handler: MessageHandler | None = None):
+        self.users: List["MCPIntegration | None"] = []
+        self.client = Client(url, log_handler=self.log_handler, message_handler=message_handler)
+        self._stack: AsyncExitStack | None = None
+        self._connect_lock = asyncio.Lock()
+
+    async def log_handler(self, message: LogMessage):
+        if len(self.users) == 1 and self.users[0]:
+            await self.users[0].log_handler(message)
+        else:
+            logging.debug(f"MCP Log Nachricht ohne eindeutige Anfrage: {message}")
+
+    @property
+    def connected(self) -> bool:
+        return self._stack is not None and self.client.is_connected()
+
+    async def ensure_connected(self, attempts: int, max_delay: float):
+        async with self._connect_lock:
+            if not self.connected:
+                await self.connect(attempts, max_delay)
+
+    async def connect(self, attempts: int, max_delay: float):
+
+        await self.close()
+
+        for attempt in range(attempts):
+            try:
+                stack = AsyncExitStack()
+                await stack.enter_async_context(self.client)
+                self._stack = stack
+                return
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise Exception(f"MCP Server nicht erreichbar: {e}")
+                delay = min(0.5 * 2 ** attempt, max_delay)
+                logging.warning(f"MCP Verbindung fehlgeschlagen ({e}), neuer Versuch in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._stack is not None:
+            stack, self._stack = self._stack, None
+            try:
+                await stack.aclose()
+            except Exception as e:
+                logging.debug(f"Fehler beim Schließen der MCP Session: {e}")
+
+
+class MCPSessionLease:
+    """Zugriff einer Anfrage auf eine geteilte Session, Progress wird an die Integration der Anfrage geleitet"""
+
+    def __init__(self, session: MCPSession, integration: "MCPIntegration | None"):
+        self.session = session
+        self.integration = integration
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any] | None = None, **kwargs) -> CallToolResult:
+        if self.integration and "progress_handler" not in kwargs:
+            kwargs["progress_handler"] = self.integration.progress_handler
+        return await self.session.client.call_tool(name, arguments, **kwargs)
+
+    async def list_tools(self) -> List[mcp.types.Tool]:
+        return await self.session.client.list_tools()
+
+
+class MCPSessionPool:
+    """Pool langlebiger MCP Sessions, die über alle Anfragen hinweg wiederverwendet werden.
+    Anfragen teilen sich die Sessions, neue werden nur bis zur Obergrenze geöffnet, solange alle bestehenden belegt sind.
+    Lange Tool Calls blockieren daher weder Steueraktionen wie das Abbrechen noch das Laden des Tool Katalogs."""
+
+    def __init__(self, url: str | None, max_sessions: int, reconnect_attempts: int, reconnect_max_delay: float):
+        self.url = url
+        self.max_sessions = max_sessions
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_max_delay = reconnect_max_delay
+        self._sessions: List[MCPSession] = []
+        self._message_handler = MCPSessionMessageHandler(self)
+        self.tool_list_changed_callbacks: List[Callable[[], None]] = []
+
+    def _acquire(self) -> MCPSession:
+
+        session = min(self._sessions, key=lambda s: len(s.users), default=None)
+
+        if session is None or (session.users and len(self._sessions) < self.max_sessions):
+            session = MCPSession(self.url, self._message_handler)
+            self._sessions.append(session)
+
+        return session
+
+    @asynccontextmanager
+    async def session(self, integration: "MCPIntegration | None" = None) -> AsyncIterator[MCPSessionLease]:
+
+        if not self.url:
+            raise Exception("Kein MCP Server URL verfügbar")
+
+        session = self._acquire()
+        session.users.append(integration)
+
+        try:
+            await session.ensure_connected(self.reconnect_attempts, self.reconnect_max_delay)
+            yield MCPSessionLease(session, integration)
+
+        except BaseException:
+            # Abgebrochene Verbindungen werden beim nächsten Gebrauch neu aufgebaut
+            if not session.client.is_connected():
+                await session.close()
+            raise
+
+        finally:
+            session.users.remove(integration)
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            await session.close()
+
+
+mcp_session_pool = MCPSessionPool(
+    url=Config.MCP_SERVER_URL,
+    max_sessions=Config.MCP_MAX_SESSIONS,
+    reconnect_attempts=Config.MCP_RECONNECT_ATTEMPTS,
+    reconnect_max_delay=Config.MCP_RECONNECT_MAX_DELAY,
+)
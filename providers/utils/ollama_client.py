@@ -0,0 +1,38 @@
+import logging
+from typing import Dict
+
+import httpx
+from ollama import AsyncClient
+
+from core.config import Config
+
+
+class OllamaClientPool:
+    """Ein gemeinsamer AsyncClient pro Ollama Host, dessen Verbindungen von allen Chats wiederverwendet werden"""
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.clients: Dict[str, AsyncClient] = {}
+
+    def get(self, host: str | None = None) -> AsyncClient:
+
+        host = host if host else Config.OLLAMA_URL
+
+        client = self.clients.get(host)
+        if client is None:
+            logging.info(f"Ollama Client für {host} wird erstellt")
+            client = AsyncClient(host=host, limits=self.limits)
+            self.clients[host] = client
+
+        return client
+
+
+ollama_client_pool = OllamaClientPool(
+    max_connections=Config.OLLAMA_MAX_CONNECTIONS,
+    max_keepalive_connections=Config.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=Config.OLLAMA_KEEPALIVE_EXPIRY,
+)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Set, AsyncIterator
+from urllib.parse import urlparse
+
+import httpx
+
+from core.config import Config
+from providers.utils.ollama_client import ollama_client_pool
+
+LOCAL_HOSTNAMES = {"localhost", "127.0.0.1", "::1"}
+
+
+def normalize_model_name(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+
+@dataclass
+class OllamaHost:
+    url: str
+    in_flight: int = 0
+    models: Set[str] = field(default_factory=set)  # Aktuell geladene Modelle laut /api/ps
+    healthy: bool = True
+    checked: float = 0.0
+    cold_models: Set[str] = field(default_factory=set)  # Gerade ohne Prompt geladen, der KV Cache ist noch leer
+
+    def take_cold(self, model: str) -> bool:
+        name = normalize_model_name(model)
+        cold = name in self.cold_models
+        self.cold_models.discard(name)
+        return cold
+
+    @property
+    def local(self) -> bool:
+        """Nur für lokale Hosts kann der VRAM über das VRAM Backend geprüft werden"""
+        return urlparse(self.url if "://" in self.url else f"http://{self.url}").hostname in LOCAL_HOSTNAMES
+
+
+class OllamaRouter:
+    """Verteilt Generierungen auf mehrere Ollama Hosts.
+    Bevorzugt werden erreichbare Hosts, die das Modell bereits geladen haben, mit den wenigsten laufenden Anfragen.
+    Der Zustand der Hosts wird über /api/ps abgefragt, sobald er älter als das Health Intervall ist."""
+
+    def __init__(self, urls: List[str], health_interval: float):
+        self.hosts = [OllamaHost(url) for url in urls]
+        self.health_interval = health_interval
+        self._refresh_lock = asyncio.Lock()
+
+    def get(self, url: str | None) -> OllamaHost | None:
+        return next((host for host in self.hosts if host.url == url), None)
+
+    async def candidates(self, model: str, preferred: str | None = None) -> List[OllamaHost]:
+        """Hosts in der Reihenfolge, in der sie versucht werden sollen"""
+
+        if len(self.hosts) == 1:
+            return list(self.hosts)
+
+        await self.refresh()
+
+        model = normalize_model_name(model)
+
+        def load(host: OllamaHost):
+            return not host.healthy, host.url != preferred, model not in host.models, host.in_flight
+
+        return sorted(self.hosts, key=load)
+
+    async def refresh(self, force: bool = False, timeout: float = 5):
+
+        async with self._refresh_lock:
+            now = time.monotonic()
+            stale = [host for host in self.hosts if force or now - host.checked >= self.health_interval]
+            if stale:
+                await asyncio.gather(*(self._check(host, timeout) for host in stale))
+
+    async def _check(self, host: OllamaHost, timeout: float):
+
+        try:
+            response = await asyncio.wait_for(ollama_client_pool.get(host.url).ps(), timeout=timeout)
+            host.models = {normalize_model_name(m.model or m.name) for m in response.models}
+            if not host.healthy:
+                logging.info(f"Ollama Host {host.url} ist wieder erreichbar")
+            host.healthy = True
+        except Exception as e:
+            if host.healthy:
+                logging.warning(f"Ollama Host {host.url} nicht erreichbar: {e}")
+            host.healthy = False
+            host.models = set()
+
+        host.checked = time.monotonic()
+
+    @asynccontextmanager
+    async def lease(self, host: OllamaHost, model: str) -> AsyncIterator[OllamaHost]:
+
+        host.in_flight += 1
+        try:
+            yield host
+        except Exception as e:
+            self.report_error(host, e)
+            raise
+        else:
+            host.models.add(normalize_model_name(model))
+        finally:
+            host.in_flight -= 1
+
+    @staticmethod
+    def report_error(host: OllamaHost, error: Exception):
+        """Bei Verbindungsfehlern und Timeouts wird der Host bis zur nächsten Prüfung nach hinten gestellt"""
+
+        if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError, asyncio.TimeoutError)):
+            logging.warning(f"Ollama Host {host.url} als nicht erreichbar markiert: {error}")
+            host.healthy = False
+            host.models = set()
+            host.checked = time.monotonic()
+
+
+ollama_router = OllamaRouter(Config.OLLAMA_URLS, health_interval=Config.OLLAMA_HEALTH_INTERVAL)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import deque
+from contextlib import nullcontext, contextmanager
+from typing import Dict, Deque, Tuple
+
+from core.config import Config
+from providers.utils.ollama_client import ollama_client_pool
+from providers.utils.ollama_router import ollama_router, normalize_model_name
+from providers.utils.vram import vram_manager
+
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def keep_alive_seconds(value: str | float | None) -> float:
+    """Keep Alive Wert in Sekunden, wie Ollama ihn interpretiert (negativ = unbegrenzt, nicht gesetzt = 5 Minuten)"""
+
+    if value is None:
+        return 300
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        parts = re.findall(r"(-?\d+(?:\.\d+)?)(ms|h|m|s)?", value)
+        seconds = sum(float(number) * DURATION_UNITS[unit or "s"] for number, unit in parts)
+    return math.inf if seconds < 0 else seconds
+
+
+class ModelResidencyManager:
+    """Steuert, wann das Modell im Ollama Speicher liegt.
+    Lädt es beim Start und nach einer Pause bei neuer Aktivität vorab, entlädt es vor VRAM intensiven Tools
+    und wählt bei OLLAMA_KEEP_ALIVE=adaptive die Keep Alive Zeit anhand der Abstände zwischen den letzten Anfragen."""
+
+    def __init__(self, model: str, keep_alive: str | float | None, min_keep_alive: float, max_keep_alive: float, window: float):
+        self.model = model
+        self.keep_alive_setting = keep_alive
+        self.min_keep_alive = min_keep_alive
+        self.max_keep_alive = max_keep_alive
+        self.window = window
+        self.activity: Deque[float] = deque(maxlen=50)
+        self.loaded_until: Dict[Tuple[str, str], float] = {}  # (Host, Modell) -> geschätzter Zeitpunkt, an dem Ollama das Modell entlädt
+        self._warmup_task: asyncio.Task | None = None
+        self._paused = 0  # Anzahl laufender Blöcke, die den VRAM für andere Anwendungen freihalten
+
+    @property
+    def adaptive(self) -> bool:
+        return self.keep_alive_setting == "adaptive"
+
+    def keep_alive(self) -> str | float | None:
+
+        if not self.adaptive:
+            return self.keep_alive_setting
+
+        now = time.monotonic()
+        recent = [t for t in self.activity if now - t <= self.window]
+        gaps = sorted(b - a for a, b in zip(recent, recent[1:]))
+
+        if not gaps:
+            return self.min_keep_alive
+
+        # Lang genug, um die meisten Pausen zwischen zwei Anfragen zu überbrücken
+        gap = gaps[min(len(gaps) - 1, int(len(gaps) * 0.9))]
+        return max(self.min_keep_alive, min(self.max_keep_alive, gap * 1.5))
+
+    def is_loaded(self, model: str | None = None, host: str | None = None) -> bool:
+        """Ohne Host: ob das Modell auf irgendeinem Host geladen ist"""
+
+        name = normalize_model_name(model or self.model)
+        now = time.monotonic()
+        return any(
+            now < until for (url, loaded), until in self.loaded_until.items()
+            if loaded == name and (host is None or url == host)
+        )
+
+    def mark_loaded(self, host: str, model: str, keep_alive: str | float | None = None):
+        keep_alive = keep_alive if keep_alive is not None else self.keep_alive()
+        self.loaded_until[(host, normalize_model_name(model))] = time.monotonic() + keep_alive_seconds(keep_alive)
+
+    def touch(self):
+        """Registriert eine Anfrage. War das Modell vermutlich schon entladen, wird es im Hintergrund wieder geladen."""
+
+        was_loaded = self.is_loaded()
+        self.activity.append(time.monotonic())
+
+        if not was_loaded:
+            logging.info(f"Aktivität nach Pause, {self.model} wird vorab geladen")
+            self.warm_up()
+
+    @contextmanager
+    def paused(self):
+        """Unterdrückt das Vorladen im Hintergrund, solange der Block läuft"""
+        self._paused += 1
+        try:
+            yield
+        finally:
+            self._paused -= 1
+
+    def warm_up(self):
+        """Lädt das Modell im Hintergrund, falls das nicht bereits läuft"""
+        if self._paused:
+            logging.debug(f"{self.model} wird nicht vorab geladen, da der VRAM gerade freigehalten wird")
+            return
+        if not (self._warmup_task and not self._warmup_task.done()):
+            self._warmup_task = asyncio.create_task(self.load())
+
+    async def load(self, model: str | None = None) -> bool:
+
+        model = model or self.model
+        keep_alive = self.keep_alive()
+
+        if keep_alive_seconds(keep_alive) == 0:
+            logging.debug(f"{model} wird nicht vorab geladen, da Keep Alive 0 ist")
+            return False
+
+        for host in await ollama_router.candidates(model):
+
+            # Auch das Vorladen muss auf freien VRAM warten, z.B. solange eine Bildgenerierung läuft
+            loaded = self.is_loaded(model, host.url)
+            vram = vram_manager.reserve(model, Config.OLLAMA_REQUIRED_VRAM, Config.VRAM_TIMEOUT) if host.local and not loaded else nullcontext()
+
+            try:
+                async with vram, ollama_router.lease(host, model):
+                    # Eine Anfrage ohne Prompt lädt das Modell nur
+                    await ollama_client_pool.get(host.url).generate(model=model, keep_alive=keep_alive)
+                host.cold_models.add(normalize_model_name(model))
+                self.mark_loaded(host.url, model, keep_alive)
+                logging.info(f"{model} auf {host.url} geladen, Keep Alive {keep_alive}")
+                return True
+            except Exception as e:
+                logging.warning(f"{model} konnte auf {host.url} nicht geladen werden: {e}")
+
+        return False
+
+    async def unload(self, model: str | None = None, local_only: bool = False) -> int:
+        """Entlädt das Modell auf allen Hosts, auf denen es geladen ist, und gibt deren Anzahl zurück"""
+
+        model = model or self.model
+        name = normalize_model_name(model)
+        unloaded = 0
+
+        for host in ollama_router.hosts:
+            if local_only and not host.local:
+                continue
+            # Bei nur einem Host wird /api/ps nicht abgefragt, die geladenen Modelle sind dann unbekannt
+            if len(ollama_router.hosts) > 1 and name not in host.models:
+                continue
+            try:
+                await ollama_client_pool.get(host.url).generate(model=model, keep_alive=0)
+                host.models.discard(name)
+                self.loaded_until.pop((host.url, name), None)
+                unloaded += 1
+                logging.info(f"{model} auf {host.url} entladen")
+            except Exception as e:
+                logging.warning(f"{model} konnte auf {host.url} nicht entladen werden: {e}")
+
+        return unloaded
+
+    async def status(self) -> str:
+
+        await ollama_router.refresh(force=True, timeout=2)
+
+        lines = []
+        for host in ollama_router.hosts:
+            state = "🟢" if host.healthy else "🔴"
+            models = ", ".join(sorted(host.models)) if host.models else "keine Modelle geladen"
+            lines.append(f"{state} {host.url}: {models} ({host.in_flight} laufende Anfragen)")
+
+        keep_alive = self.keep_alive()
+        if isinstance(keep_alive, float):
+            keep_alive = f"{keep_alive:.0f}s"
+        lines.append(f"Keep Alive: {keep_alive or 'Standard'}{' (adaptiv)' if self.adaptive else ''}")
+
+        return "\n".join(lines)
+
+
+residency_manager = ModelResidencyManager(
+    model=Config.OLLAMA_MODEL,
+    keep_alive=Config.OLLAMA_KEEP_ALIVE,
+    min_keep_alive=Config.OLLAMA_KEEP_ALIVE_MIN,
+    max_keep_alive=Config.OLLAMA_KEEP_ALIVE_MAX,
+    window=Config.OLLAMA_KEEP_ALIVE_WINDOW,
+)
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, TYPE_CHECKING
+
+from core.config import Config
+from providers.utils.chat import LLMChat
+
+if TYPE_CHECKING:
+    from providers.base import LLMResponse
+
+META_TAG_PATTERN = re.compile(r"<#[^>]*>")
+
+
+def normalize_turn(content: str) -> str:
+    """Entfernt Meta Tags wie Absender und Uhrzeit, damit gleiche Fragen unabhängig vom Zeitpunkt gleich sind"""
+    return " ".join(META_TAG_PATTERN.sub(" ", content).split()).casefold()
+
+
+@dataclass
+class CachedResponse:
+    response: "LLMResponse"
+    expires: float
+
+
+class ResponseCache:
+    """Cache für Antworten deterministischer Generierungen (Temperatur 0).
+    Der Schlüssel besteht aus Modell, Optionen, System Eintrag und den normalisierten letzten User Nachrichten.
+    Anfragen mit Bildern oder Tool Results am Ende werden nicht gecacht, ebenso Antworten mit Tool Calls."""
+
+    def __init__(self, enabled: bool, ttl: float, max_entries: int):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def key(self, options: Dict | None, chat: LLMChat) -> str | None:
+
+        if not self.enabled:
+            return None
+
+        trailing_turns: List[Dict] = []
+        for entry in reversed(chat.history):
+            if entry["role"] != "user":
+                break
+            trailing_turns.insert(0, entry)
+
+        if options is None or not trailing_turns or any(entry.get("images") for entry in trailing_turns):
+            self.bypassed += 1
+            return None
+
+        key = json.dumps({
+            "options": options,
+            "system": chat.system_entry if chat.system_entry and chat.system_entry["role"] == "system" else None,
+            "turns": [normalize_turn(entry.get("content", "")) for entry in trailing_turns],
+        }, sort_keys=True, ensure_ascii=False, default=str)
+
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> "LLMResponse | None":
+
+        cached = self._entries.get(key)
+        if cached is not None:
+            if cached.expires > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                logging.info(f"Antwort aus dem Cache: {self.stats()}")
+                return cached.response
+            del self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response: "LLMResponse"):
+
+        if response.tool_calls or "```tool" in (response.text or ""):
+            return
+
+        self._entries[key] = CachedResponse(response=response, expires=time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        logging.debug(f"Response Cache: {self.stats()}")
+
+    def stats(self) -> Dict[str, int | float]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+response_cache = ResponseCache(
+    enabled=Config.RESPONSE_CACHE,
+    ttl=Config.RESPONSE_CACHE_TTL,
+    max_entries=Config.RESPONSE_CACHE_SIZE,
+)
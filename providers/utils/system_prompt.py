@@ -0,0 +1,81 @@
+import hashlib
+import os
+from dataclasses import dataclass, field, replace
+from typing import Dict, Tuple
+
+
+SEGMENT_ORDER = ("instructions", "tools", "channel")  # Stabile Segmente zuerst, damit der Prompt Cache des Backends greift
+
+
+def segment_version(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=4).hexdigest()
+
+
+@dataclass(frozen=True)
+class SystemPrompt:
+    """System Prompt aus versionierten Segmenten: Basis Instruktionen, Tool Katalog und flüchtige Channel Infos.
+    Die Segmente werden immer in derselben Reihenfolge zusammengesetzt, unveränderte Segmente bleiben daher Byte für Byte gleich."""
+
+    segments: Dict[str, Tuple[str, str]] = field(default_factory=dict)  # Name -> (Inhalt, Version)
+
+    @staticmethod
+    def build(**contents: str | None) -> "SystemPrompt":
+        return SystemPrompt().with_segments(**contents)
+
+    def with_segments(self, **contents: str | None) -> "SystemPrompt":
+
+        segments = dict(self.segments)
+        for name, content in contents.items():
+            if name not in SEGMENT_ORDER:
+                raise ValueError(f"Unbekanntes System Prompt Segment: {name}")
+            if content:
+                segments[name] = (content, segment_version(content))
+            else:
+                segments.pop(name, None)
+
+        return replace(self, segments=segments)
+
+    def get(self, name: str) -> str | None:
+        segment = self.segments.get(name)
+        return segment[0] if segment else None
+
+    def versions(self) -> Dict[str, str]:
+        return {name: self.segments[name][1] for name in SEGMENT_ORDER if name in self.segments}
+
+    def render(self) -> str:
+        return "\n\n".join(self.segments[name][0].strip("\n") for name in SEGMENT_ORDER if name in self.segments)
+
+    def entry(self) -> Dict[str, str]:
+        return {"role": "system", "content": self.render()}
+
+
+class PrefixReuseStats:
+    """Misst, welcher Anteil des System Prompts bei einer Änderung als unveränderter Präfix erhalten bleibt"""
+
+    def __init__(self):
+        self.updates = 0
+        self.unchanged = 0
+        self.reused_chars = 0
+        self.total_chars = 0
+
+    def record(self, previous: str | None, current: str) -> float:
+
+        self.updates += 1
+        reused = len(os.path.commonprefix([previous, current])) if previous else 0
+        if previous == current:
+            self.unchanged += 1
+
+        self.reused_chars += reused
+        self.total_chars += len(current)
+
+        return reused / len(current) if current else 1.0
+
+    def stats(self) -> Dict[str, int | float]:
+        return {
+            "updates": self.updates,
+            "unchanged": self.unchanged,
+            "prefix_reuse": self.reused_chars / self.total_chars if self.total_chars else 0.0,
+        }
+
+
+prefix_reuse_stats = PrefixReuseStats()
@@ -0,0 +1,64 @@
+import functools
+import logging
+import os
+from typing import Dict
+
+import tiktoken
+
+from core.config import Config
+
+
+@functools.cache
+def get_tokenizer() -> tiktoken.Encoding:
+    """Lädt den Tokenizer einmalig. Die BPE Datei wird in TIKTOKEN_CACHE_DIR gespeichert, damit spätere Starts offline funktionieren."""
+
+    if Config.TIKTOKEN_CACHE_DIR:
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", Config.TIKTOKEN_CACHE_DIR)
+        os.makedirs(os.environ["TIKTOKEN_CACHE_DIR"], exist_ok=True)
+
+    tokenizer = tiktoken.get_encoding(Config.TOKENIZER_ENCODING)
+    logging.debug(f"Tokenizer geladen: {tokenizer.name}")
+
+    return tokenizer
+
+
+class TokenCalibration:
+    """Lernt pro Modell einen Korrekturfaktor zwischen der tiktoken Schätzung und der vom Backend gemeldeten Prompt Tokenanzahl.
+    Der Faktor enthält auch den Overhead des Chat Templates, sodass Budgets ohne weiteren Tokenisierungsdurchlauf der echten Kontextnutzung folgen."""
+
+    def __init__(self, smoothing: float = 0.2, min_ratio: float = 0.5, max_ratio: float = 4.0):
+        self.smoothing = smoothing
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.factors: Dict[str, float] = {}
+        self.samples: Dict[str, int] = {}
+
+    def factor(self, model: str | None) -> float:
+        return self.factors.get(model, 1.0) if model else 1.0
+
+    def calibrated(self, model: str | None, estimated: int) -> int:
+        return round(estimated * self.factor(model))
+
+    def observe(self, model: str | None, estimated: int, actual: int | None):
+
+        if not model or not estimated or not actual:
+            return
+
+        ratio = actual / estimated
+
+        # Ausreißer verwerfen, z.B. falls doch ein Teil des Prompts aus dem Cache kam
+        if not self.min_ratio <= ratio <= self.max_ratio:
+            logging.debug(f"Token Kalibrierung für {model} ignoriert: {actual} / {estimated} = {ratio:.2f}")
+            return
+
+        previous = self.factors.get(model)
+        self.factors[model] = ratio if previous is None else previous + self.smoothing * (ratio - previous)
+        self.samples[model] = self.samples.get(model, 0) + 1
+
+        logging.debug(f"Token Korrekturfaktor für {model}: {self.factors[model]:.3f} ({actual} / {estimated})")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {model: {"factor": factor, "samples": self.samples[model]} for model, factor in self.factors.items()}
+
+
+token_calibration = TokenCalibration()
@@ -23,9 +23,7 @@ def mcp_to_dict_tools(mcp_tools: List[Tool]) -> List[Dict[str, str|Dict]]:
     return dict_tools
 
 
-def get_custom_tools_system_prompt(mcp_tools: List[Tool]) -> str:
-
-    dict_tools = mcp_to_dict_tools(mcp_tools)
+def get_custom_tools_system_prompt(dict_tools: List[Dict[str, str|Dict]]) -> str:
 
     match Config.LANGUAGE:
         case "de":
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Set
+
+from fastmcp.tools import Tool
+
+from core.config import Config
+from providers.utils.mcp_client_integrations.base import MCPIntegration
+from providers.utils.mcp_session_pool import mcp_session_pool
+from providers.utils.tool_calls import mcp_to_dict_tools, get_custom_tools_system_prompt, get_tools_system_prompt
+
+
+@dataclass
+class ToolCatalog:
+    version: int
+    tools: List[Tool]
+    dict_tools: List[Dict[str, str | Dict]]
+    system_prompt: str
+    serial_tools: Set[str]
+    cache_ttls: Dict[str, float]
+    unload_tools: Set[str]
+    created: float
+
+
+def tool_tags(tool: Tool) -> List[str]:
+    return ((tool.meta or {}).get("_fastmcp") or {}).get("tags", [])
+
+
+def is_serial_tool(tool: Tool) -> bool:
+    """Tools mit dem Tag "serial" oder meta {"serial": true} dürfen nicht parallel zu anderen Tools laufen"""
+
+    return bool((tool.meta or {}).get("serial")) or "serial" in tool_tags(tool)
+
+
+def tool_cache_ttl(tool: Tool) -> float | None:
+    """Ergebnisse dürfen gecacht werden, wenn das Tool meta {"cache_ttl": Sekunden} oder den Tag "cacheable" hat"""
+
+    ttl = (tool.meta or {}).get("cache_ttl")
+    if ttl is not None:
+        return float(ttl)
+    if "cacheable" in tool_tags(tool):
+        return Config.MCP_TOOL_RESULT_CACHE_TTL
+    return None
+
+
+class ToolCatalogCache:
+    """Cache der gefilterten MCP Tools samt vorberechneter Dict-Form und Tool Prompt.
+    Wird bei einer tools/list_changed Benachrichtigung des Servers oder nach Ablauf der TTL neu geladen."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._catalogs: Dict[Tuple, ToolCatalog] = {}
+        self._locks: Dict[Tuple, asyncio.Lock] = {}
+        self._version = 0
+
+        mcp_session_pool.tool_list_changed_callbacks.append(self.invalidate)
+
+    @staticmethod
+    def key(integration: MCPIntegration) -> Tuple:
+        return Config.MCP_SERVER_URL, type(integration).__name__, tuple(Config.MCP_TOOL_TAGS)
+
+    def _fresh(self, catalog: ToolCatalog | None) -> bool:
+        return catalog is not None and time.monotonic() - catalog.created < self.ttl
+
+    async def get(self, integration: MCPIntegration) -> ToolCatalog:
+
+        key = self.key(integration)
+
+        catalog = self._catalogs.get(key)
+        if self._fresh(catalog):
+            return catalog
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+
+            catalog = self._catalogs.get(key)
+            if self._fresh(catalog):
+                return catalog
+
+            async with mcp_session_pool.session(integration) as client:
+                mcp_tools = await client.list_tools()
+
+            mcp_tools = integration.filter_tool_list(mcp_tools)
+            dict_tools = mcp_to_dict_tools(mcp_tools)
+
+            self._version += 1
+            catalog = ToolCatalog(
+                version=self._version,
+                tools=mcp_tools,
+                dict_tools=dict_tools,
+                system_prompt=get_custom_tools_system_prompt(dict_tools) if not Config.TOOL_INTEGRATION else get_tools_system_prompt(),
+                serial_tools={tool.name for tool in mcp_tools if is_serial_tool(tool)},
+                cache_ttls={tool.name: ttl for tool in mcp_tools if (ttl := tool_cache_ttl(tool))},
+                unload_tools={tool.name for tool in mcp_tools if set(tool_tags(tool)) & set(Config.RESIDENCY_UNLOAD_TAGS)},
+                created=time.monotonic(),
+            )
+            self._catalogs[key] = catalog
+
+            logging.info(f"Tool Katalog Version {catalog.version} geladen: {[tool.name for tool in mcp_tools]}")
+
+            return catalog
+
+    def invalidate(self):
+        self._catalogs.clear()
+
+
+tool_catalog_cache = ToolCatalogCache(ttl=Config.MCP_TOOL_CATALOG_TTL)
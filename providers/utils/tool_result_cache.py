@@ -0,0 +1,113 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple, Callable, Awaitable
+
+from mcp.types import CallToolResult
+
+from core.config import Config
+
+
+@dataclass
+class CachedToolResult:
+    result: CallToolResult
+    expires: float
+    latency: float
+
+
+class ToolResultCache:
+    """Cache für Ergebnisse lesender MCP Tools, nur für Tools mit einer TTL.
+    Gleichzeitige identische Aufrufe teilen sich eine einzige laufende Anfrage (Single Flight)."""
+
+    def __init__(self, enabled: bool, max_entries: int):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[str, str], CachedToolResult] = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.saved_latency = 0.0
+
+    @staticmethod
+    def key(name: str, arguments: Dict) -> Tuple[str, str]:
+        return name, json.dumps(arguments, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+    async def call(self, name: str, arguments: Dict, ttl: float | None, execute: Callable[[], Awaitable[CallToolResult]]) -> CallToolResult:
+
+        if not self.enabled or not ttl:
+            return await execute()
+
+        key = self.key(name, arguments)
+        now = time.monotonic()
+
+        cached = self._entries.get(key)
+        if cached is not None:
+            if cached.expires > now:
+                self.hits += 1
+                self.saved_latency += cached.latency
+                self._entries.move_to_end(key)
+                logging.info(f"Tool Result aus dem Cache: {name}")
+                return cached.result
+            del self._entries[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.shared += 1
+            logging.info(f"Tool Call wartet auf identischen laufenden Aufruf: {name}")
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # Wurde nur der führende Aufruf abgebrochen, führt diese Anfrage den Tool Call selbst aus
+                if in_flight.cancelled() and not asyncio.current_task().cancelling():
+                    logging.info(f"Geteilter Tool Call wurde abgebrochen, neuer Versuch: {name}")
+                    return await self.call(name, arguments, ttl, execute)
+                raise
+
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Exception gilt auch ohne Wartende als abgerufen
+        self._in_flight[key] = future
+
+        try:
+            result = await execute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        latency = time.monotonic() - now
+
+        # Fehlerhafte Tool Calls werfen eine Exception und landen daher nie im Cache
+        self._entries[key] = CachedToolResult(result=result, expires=time.monotonic() + ttl, latency=latency)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        future.set_result(result)
+
+        logging.debug(f"Tool Result Cache: {self.stats()}")
+
+        return result
+
+    def stats(self) -> Dict[str, int | float]:
+        requests = self.hits + self.misses + self.shared
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_rate": (self.hits + self.shared) / requests if requests else 0.0,
+            "saved_latency": self.saved_latency,
+        }
+
+
+tool_result_cache = ToolResultCache(enabled=Config.MCP_TOOL_RESULT_CACHE, max_entries=Config.MCP_TOOL_RESULT_CACHE_SIZE)
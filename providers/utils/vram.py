@@ -1,27 +1,193 @@
 import asyncio
-import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Dict, Protocol, Deque, AsyncIterator, Callable
 
-import pynvml
+from core.config import Config
 
-def check_free_vram(required_gb:float=8):
-    pynvml.nvmlInit()
-    handle = pynvml.nvmlDeviceGetHandleByIndex(0)  # Nur GPU 0
-    info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-    free_gb = info.free / 1024**3
-    if free_gb < required_gb:
-        raise RuntimeError(f"Nicht genug VRAM: {free_gb:.2f} GB frei, {required_gb} GB benötigt")
-    print(f"Genug VRAM vorhanden: {free_gb:.2f} GB frei")
+GB = 1024 ** 3
 
-async def wait_for_vram(required_gb:float=8, timeout:float=20, interval:float=1):
 
-    start = time.time()
+class VRAMBackend(Protocol):
+
+    def free_memory(self) -> List[int]:
+        """Freier VRAM in Bytes pro GPU"""
+        ...
+
+
+class NVMLBackend:
+    """Liest den freien VRAM aller GPUs über NVML, das nur einmal initialisiert wird"""
+
+    def __init__(self):
+        import pynvml
+
+        self.nvml = pynvml
+        pynvml.nvmlInit()
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+
+    def free_memory(self) -> List[int]:
+        return [self.nvml.nvmlDeviceGetMemoryInfo(handle).free for handle in self.handles]
+
+
+class FakeVRAMBackend:
+    """Backend ohne GPU, z.B. für Tests. Der freie Speicher kann direkt gesetzt werden."""
+
+    def __init__(self, free_gb: List[float]):
+        self.free = [int(gb * GB) for gb in free_gb]
+
+    def free_memory(self) -> List[int]:
+        return list(self.free)
+
+
+@dataclass
+class VRAMReservation:
+    model: str
+    gpu: int
+    required: int
+    count: int = 1
+
+
+@dataclass
+class VRAMWaiter:
+    model: str
+    required: int
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class VRAMManager:
+    """Vergibt VRAM Reservierungen pro Modell in FIFO Reihenfolge.
+    Anfragen für ein Modell, das bereits eine Reservierung hat, teilen sich diese, da das Modell schon geladen ist,
+    ziehen aber nicht an bereits wartenden Anfragen vorbei.
+    Solange Anfragen warten, wird der freie Speicher regelmäßig neu gelesen, da andere Prozesse VRAM freigeben können.
+
+    Vom freien Speicher werden alle Reservierungen abgezogen, auch wenn das Modell bereits geladen ist und sein
+    Speicher schon in den Werten von NVML fehlt. Das ist eine bewusst konservative Grenze: Welcher Anteil des
+    belegten Speichers zu welcher Reservierung gehört, lässt sich nicht zuverlässig bestimmen, da andere Prozesse
+    (z.B. die Bildgenerierung) gleichzeitig Speicher belegen. Im schlimmsten Fall wartet eine Anfrage, bis die
+    laufende Anfrage ihre Reservierung freigibt, statt dass zu viel VRAM vergeben wird."""
+
+    def __init__(self, backend: VRAMBackend | None = None, poll_interval: float = 2.0, backend_factory: Callable[[], VRAMBackend | None] | None = None):
+        self._backend = backend
+        self._backend_factory = backend_factory
+        self.poll_interval = poll_interval
+        self.reservations: Dict[str, VRAMReservation] = {}
+        self._waiters: Deque[VRAMWaiter] = deque()
+        self._poll_task: asyncio.Task | None = None
+
+    @property
+    def backend(self) -> VRAMBackend | None:
+        """Das Backend (z.B. NVML) wird erst beim ersten Gebrauch initialisiert"""
+        if self._backend_factory is not None:
+            self._backend = self._backend_factory()
+            self._backend_factory = None
+        return self._backend
+
+    def gpu_count(self) -> int:
+        return len(self.backend.free_memory()) if self.backend else 0
+
+    @asynccontextmanager
+    async def reserve(self, model: str, required_gb: float, timeout: float | None = None) -> AsyncIterator[VRAMReservation | None]:
+
+        if self.backend is None or not required_gb:
+            yield None
+            return
+
+        reservation = self.reservations.get(model)
+
+        if reservation is not None and not self._waiters:
+            reservation.count += 1
+        else:
+            waiter = VRAMWaiter(model=model, required=int(required_gb * GB))
+            self._waiters.append(waiter)
+            self._admit()
+
+            if not waiter.future.done():
+                self._start_polling()
+
+            try:
+                reservation = await asyncio.wait_for(asyncio.shield(waiter.future), timeout=timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self._release(waiter.future.result())
+                else:
+                    waiter.future.cancel()
+                    self._waiters.remove(waiter)
+                    self._admit()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise TimeoutError(f"Timeout: Nicht genug VRAM für {model}, {required_gb} GB benötigt")
+                raise
 
-    while True:
         try:
-            check_free_vram(required_gb=required_gb)
-            break
-        except RuntimeError as e:
-            if (time.time() - start) >= timeout:
-                raise TimeoutError(f"Timeout: {e}")
+            yield reservation
+        finally:
+            self._release(reservation)
+
+    def _available(self) -> List[int]:
+        available = self.backend.free_memory()
+        for reservation in self.reservations.values():
+            available[reservation.gpu] -= reservation.required
+        return available
+
+    def _admit(self):
+
+        while self._waiters:
+
+            waiter = self._waiters[0]
+
+            reservation = self.reservations.get(waiter.model)
+            if reservation is not None:
+                reservation.count += 1
             else:
-                await asyncio.sleep(interval)
\ No newline at end of file
+                available = self._available()
+                gpu = max(range(len(available)), key=lambda i: available[i], default=None)
+
+                if gpu is None or available[gpu] < waiter.required:
+                    logging.debug(f"VRAM: {waiter.model} wartet auf {waiter.required / GB:.1f} GB, verfügbar {[f'{a / GB:.1f}' for a in available]}")
+                    return  # FIFO: keine nachfolgende Anfrage darf vorbeiziehen
+
+                reservation = VRAMReservation(model=waiter.model, gpu=gpu, required=waiter.required)
+                self.reservations[waiter.model] = reservation
+                logging.info(f"VRAM reserviert: {waiter.model} auf GPU {gpu} ({waiter.required / GB:.1f} GB)")
+
+            self._waiters.popleft()
+            waiter.future.set_result(reservation)
+
+    def _release(self, reservation: VRAMReservation):
+
+        reservation.count -= 1
+        if reservation.count <= 0 and self.reservations.get(reservation.model) is reservation:
+            del self.reservations[reservation.model]
+            logging.info(f"VRAM freigegeben: {reservation.model}")
+
+        self._admit()
+
+    def _start_polling(self):
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll())
+
+    async def _poll(self):
+        while self._waiters:
+            await asyncio.sleep(self.poll_interval)
+            self._admit()
+
+
+def create_vram_backend() -> VRAMBackend | None:
+
+    match Config.VRAM_BACKEND:
+        case "nvml":
+            try:
+                return NVMLBackend()
+            except Exception as e:
+                logging.warning(f"NVML nicht verfügbar, VRAM wird nicht geprüft: {e}")
+                return None
+        case "fake":
+            return FakeVRAMBackend(Config.VRAM_FAKE_GB)
+        case "none":
+            return None
+        case _:
+            raise ValueError(f"Ungültiges VRAM Backend: {Config.VRAM_BACKEND}")
+
+
+vram_manager = VRAMManager(backend_factory=create_vram_backend, poll_interval=Config.VRAM_POLL_INTERVAL)
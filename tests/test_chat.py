@@ -0,0 +1,53 @@
+import logging
+
+import pytest
+
+from providers.utils import chat as chat_module
+from providers.utils.chat import LLMChat
+
+
+class WordTokenizer:
+    """Zählt Wörter statt BPE Tokens, damit der Test ohne heruntergeladene Tokenizer Datei läuft"""
+
+    name = "words"
+
+    @staticmethod
+    def encode(text: str):
+        return text.split()
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    monkeypatch.setattr(chat_module, "get_tokenizer", lambda: WordTokenizer())
+    monkeypatch.setattr(chat_module, "default_max_tokens", lambda: 60)
+    monkeypatch.setattr(chat_module.Config, "HISTORY_TRIM_MODE", "window")
+    return LLMChat()
+
+
+def message(i: int):
+    return {"role": "user", "content": f"Nachricht {i} " + "wort " * 8}
+
+
+def test_trim_then_next_message_keeps_overlap(chat, caplog):
+
+    window = [message(i) for i in range(10)]
+    chat.update_history(window)
+
+    assert chat.count_tokens() <= 60
+    first_kept = chat.history[0]
+    assert first_kept != window[0]
+
+    # Antwort des Modells samt Tool Result
+    reply = {"role": "assistant", "content": "Antwort"}
+    tool_result = {"role": "system", "id": "tool", "content": "#Ergebnis"}
+    chat.history.append(reply)
+    chat.history.append(tool_result)
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        chat.update_history([*window[1:], reply, message(10)])
+
+    assert "KEIN OVERLAP" not in caplog.text
+    assert tool_result in chat.history
+    assert chat.history[-1] == message(10)
+    assert chat.count_tokens() <= 60
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from providers.utils.vram import VRAMManager, FakeVRAMBackend, GB
+
+
+def manager(*free_gb: float) -> VRAMManager:
+    return VRAMManager(FakeVRAMBackend(list(free_gb)), poll_interval=0.01)
+
+
+async def hold(vram: VRAMManager, model: str, required_gb: float, release: asyncio.Event, granted: list, timeout: float | None = None):
+    async with vram.reserve(model, required_gb, timeout=timeout):
+        granted.append(model)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_reserved_model_does_not_pass_queued_waiter():
+
+    async def scenario():
+        vram = manager(10)
+        granted = []
+        release_a, release_b, release_c = asyncio.Event(), asyncio.Event(), asyncio.Event()
+
+        first = asyncio.create_task(hold(vram, "a", 8, release_a, granted))
+        await settle()
+        second = asyncio.create_task(hold(vram, "b", 8, release_b, granted))
+        await settle()
+        # "a" hat bereits eine Reservierung, muss aber hinter "b" warten
+        third = asyncio.create_task(hold(vram, "a", 8, release_c, granted))
+        await settle()
+
+        assert granted == ["a"]
+
+        release_a.set()
+        await settle()
+        assert granted == ["a", "b"]
+
+        release_b.set()
+        release_c.set()
+        await asyncio.wait_for(asyncio.gather(first, second, third), timeout=1)
+
+        assert granted == ["a", "b", "a"]
+        assert not vram.reservations and not vram._waiters
+
+    asyncio.run(scenario())
+
+
+def test_timeout_removes_waiter_and_admits_next():
+
+    async def scenario():
+        vram = manager(4)
+        granted = []
+        release = asyncio.Event()
+        release.set()
+
+        big = asyncio.create_task(hold(vram, "big", 8, release, granted, timeout=0.05))
+        await settle()
+        small = asyncio.create_task(hold(vram, "small", 2, release, granted))
+
+        with pytest.raises(TimeoutError):
+            await big
+        await asyncio.wait_for(small, timeout=1)
+
+        assert granted == ["small"]
+        assert not vram.reservations and not vram._waiters
+
+    asyncio.run(scenario())
+
+
+def test_cancellation_removes_waiter():
+
+    async def scenario():
+        vram = manager(4)
+        granted = []
+
+        waiting = asyncio.create_task(hold(vram, "a", 8, asyncio.Event(), granted))
+        await settle()
+        assert len(vram._waiters) == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        assert not granted
+        assert not vram.reservations and not vram._waiters
+
+    asyncio.run(scenario())
+
+
+def test_shared_reservation_is_released_with_last_user():
+
+    async def scenario():
+        vram = manager(10)
+        granted = []
+        release_first, release_second = asyncio.Event(), asyncio.Event()
+
+        first = asyncio.create_task(hold(vram, "a", 8, release_first, granted))
+        second = asyncio.create_task(hold(vram, "a", 8, release_second, granted))
+        await settle()
+
+        assert granted == ["a", "a"]
+        assert vram.reservations["a"].count == 2
+
+        release_first.set()
+        await first
+        assert vram.reservations["a"].count == 1
+
+        release_second.set()
+        await second
+        assert not vram.reservations
+
+    asyncio.run(scenario())
+
+
+def test_poller_admits_when_memory_is_freed():
+
+    async def scenario():
+        backend = FakeVRAMBackend([4])
+        vram = VRAMManager(backend, poll_interval=0.01)
+        granted = []
+        release = asyncio.Event()
+        release.set()
+
+        waiting = asyncio.create_task(hold(vram, "a", 8, release, granted))
+        await asyncio.sleep(0.05)
+        assert not granted
+
+        # Ein anderer Prozess gibt VRAM frei
+        backend.free = [10 * GB]
+        await asyncio.wait_for(waiting, timeout=1)
+
+        assert granted == ["a"]
+        assert not vram._waiters
+
+    asyncio.run(scenario())